@@ -10,8 +10,79 @@ from datetime import datetime
 from jinja2 import Environment, FileSystemLoader
 import html
 
+def get_srcsets(db_path='images.db'):
+    """从处理数据库读取已上传的srcset派生图，返回 {图片ID: "url 320w, url 640w, ..."}"""
+    if not os.path.exists(db_path):
+        return {}
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("""
+            SELECT image_id, width, url FROM image_derivatives
+            WHERE url IS NOT NULL
+            ORDER BY image_id, width
+        """)
+        rows = cursor.fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    
+    conn.close()
+    
+    srcsets = {}
+    for image_id, width, url in rows:
+        srcsets.setdefault(image_id, []).append(f"{url} {width}w")
+    return {image_id: ', '.join(entries) for image_id, entries in srcsets.items()}
+
+def get_placeholders(db_path='images.db'):
+    """从处理数据库读取占位图和主色，返回 {图片ID: (占位图data URI, 主色)}"""
+    if not os.path.exists(db_path):
+        return {}
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("""
+            SELECT id, placeholder, dominant_color FROM images
+            WHERE placeholder IS NOT NULL OR dominant_color IS NOT NULL
+        """)
+        rows = cursor.fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    
+    conn.close()
+    return {image_id: (placeholder, color) for image_id, placeholder, color in rows}
+
+def get_cutouts(db_path='images.db'):
+    """从处理数据库读取抠图输出尺寸（裁剪后）和已上传抠图PNG的公开URL，返回 {图片ID: (宽, 高, URL)}"""
+    if not os.path.exists(db_path):
+        return {}
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("""
+            SELECT id, cutout_width, cutout_height,
+                   CASE WHEN uploaded = TRUE THEN url_regular END
+            FROM images
+            WHERE cutout_width IS NOT NULL AND cutout_height IS NOT NULL
+        """)
+        rows = cursor.fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    
+    conn.close()
+    return {image_id: (width, height, url) for image_id, width, height, url in rows}
+
 def get_images_from_db():
     """从数据库获取所有图片信息"""
+    srcsets = get_srcsets()
+    placeholders = get_placeholders()
+    cutouts = get_cutouts()
+    
     conn = sqlite3.connect('thinkora.db')
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
@@ -41,15 +112,24 @@ def get_images_from_db():
         else:
             image_url = f"/images/{image_filename}"
         
+        # 裁剪后的抠图尺寸和原图不同，有记录时以抠图尺寸为准
+        width, height, cutout_url = cutouts.get(row['id'], (row['width'], row['height'], None))
+        
         images.append({
             'id': row['id'],
             'title': row['title'],
             'description': row['description'],
             'author': row['author_name'],
             'authorUrl': row['author_url'] or '#',
-            'width': row['width'],
-            'height': row['height'],
+            'width': width,
+            'height': height,
             'imageUrl': image_url,
+            'srcset': srcsets.get(row['id']),
+            # srcset的全尺寸候选必须和派生图是同一张抠图：已上传的抠图PNG及其记录的宽度，没有时不加入
+            'fullUrl': cutout_url,
+            'fullWidth': width if cutout_url else None,
+            'placeholder': placeholders.get(row['id'], (None, None))[0],
+            'dominantColor': placeholders.get(row['id'], (None, None))[1],
             'downloadUrl': image_url,
             'tags': tags,
             'category': row['category'] or 'uncategorized',
@@ -161,6 +241,10 @@ def create_seo_index_template():
                 <a href="/images/{{ image.id }}.html" title="{{ image.seoTitle }}">
                     <div class="image-card__image-wrapper">
                         <img src="{{ image.imageUrl }}" 
+                             {% if image.srcset %}srcset="{{ image.srcset }}{% if image.fullUrl %}, {{ image.fullUrl }} {{ image.fullWidth }}w{% endif %}"
+                             sizes="(max-width: 640px) 100vw, (max-width: 1024px) 50vw, 320px"{% endif %}
+                             {% if image.placeholder or image.dominantColor %}style="background: {{ image.dominantColor or 'transparent' }}{% if image.placeholder %} url({{ image.placeholder }}) center / contain no-repeat{% endif %}"
+                             onload="this.removeAttribute('style')"{% endif %}
                              alt="{{ image.seoTitle }}" 
                              loading="lazy" 
                              width="{{ image.width }}" 
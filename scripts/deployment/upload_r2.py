@@ -17,6 +17,13 @@ from dotenv import load_dotenv
 # 加载环境变量
 load_dotenv()
 
+# 派生图扩展名对应的Content-Type
+CONTENT_TYPES = {
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+}
+
 class R2Uploader:
     def __init__(self):
         self.db_path = "images.db"
@@ -124,12 +131,78 @@ class R2Uploader:
             
             # 更新数据库
             self.mark_as_uploaded(image_id, f"{self.public_url}/{r2_key}")
-            
             return True, "上传成功"
             
         except Exception as e:
             return False, f"上传失败: {e}"
     
+    def get_pending_derivatives(self):
+        """获取还没有公开URL的srcset派生图，与主图是否已上传无关；处理流程没有生成时返回空列表"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("""
+                SELECT image_id, width, format, path FROM image_derivatives
+                WHERE url IS NULL
+                ORDER BY image_id, width
+            """)
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        
+        conn.close()
+        return rows
+    
+    def upload_derivative(self, image_id, width, fmt, path, force=False):
+        """上传一张srcset派生图，R2键与本地文件名一致：images/{图片ID}_{宽度}w.{格式}
+        
+        R2上已有同样大小的文件时只记录URL；重新处理后大小变化的派生图重新上传
+        """
+        local_path = Path(path)
+        if not local_path.exists():
+            return False, f"本地文件不存在: {local_path}"
+        
+        r2_key = f"images/{local_path.name}"
+        public_url = f"{self.public_url}/{r2_key}"
+        
+        if not force:
+            try:
+                head = self.s3_client.head_object(Bucket=self.bucket_name, Key=r2_key)
+                if head.get('ContentLength') == local_path.stat().st_size:
+                    self.mark_derivative_uploaded(image_id, width, fmt, public_url)
+                    return True, "文件已存在"
+            except:
+                pass  # 文件不存在，继续上传
+        
+        try:
+            self.s3_client.upload_file(
+                str(local_path),
+                self.bucket_name,
+                r2_key,
+                ExtraArgs={
+                    'ContentType': CONTENT_TYPES.get(local_path.suffix, 'application/octet-stream'),
+                    'CacheControl': 'public, max-age=31536000'
+                }
+            )
+            self.mark_derivative_uploaded(image_id, width, fmt, public_url)
+            return True, "上传成功"
+        except Exception as e:
+            return False, f"上传失败: {e}"
+    
+    def mark_derivative_uploaded(self, image_id, width, fmt, public_url):
+        """记录派生图的公开URL"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            UPDATE image_derivatives SET url = ?
+            WHERE image_id = ? AND width = ? AND format = ?
+        """, (public_url, image_id, width, fmt))
+        
+        conn.commit()
+        conn.close()
+    
     def mark_as_uploaded(self, image_id, public_url):
         """标记为已上传"""
         conn = sqlite3.connect(self.db_path)
@@ -148,41 +221,65 @@ class R2Uploader:
         conn.close()
     
     def upload_batch(self, force=False, max_workers=5):
-        """批量上传"""
+        """批量上传：待上传的主图，以及所有还没有公开URL的srcset派生图（上传失败的下次运行重试）"""
         if not self.test_connection():
             return 0
         
         images = self.get_pending_uploads()
+        derivatives = self.get_pending_derivatives()
         
-        if not images:
+        if not images and not derivatives:
             print("📋 没有待上传的图片")
             return 0
         
-        print(f"🚀 开始上传 {len(images)} 张图片到R2...")
-        
         success_count = 0
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交任务
-            future_to_image = {
-                executor.submit(self.upload_single_file, image, force): image 
-                for image in images
-            }
+            if images:
+                print(f"🚀 开始上传 {len(images)} 张图片到R2...")
+                
+                # 提交任务
+                future_to_image = {
+                    executor.submit(self.upload_single_file, image, force): image 
+                    for image in images
+                }
+                
+                # 处理结果
+                for i, future in enumerate(as_completed(future_to_image), 1):
+                    image = future_to_image[future]
+                    try:
+                        success, message = future.result()
+                        if success:
+                            success_count += 1
+                            print(f"✅ ({i}/{len(images)}) {image['id']}")
+                        else:
+                            print(f"❌ ({i}/{len(images)}) {image['id']}: {message}")
+                    except Exception as e:
+                        print(f"❌ ({i}/{len(images)}) {image['id']}: 处理异常 {e}")
+                
+                print(f"✅ 批量上传完成: {success_count}/{len(images)} 成功")
             
-            # 处理结果
-            for i, future in enumerate(as_completed(future_to_image), 1):
-                image = future_to_image[future]
-                try:
-                    success, message = future.result()
+            if derivatives:
+                print(f"🖼️ 上传 {len(derivatives)} 张srcset派生图...")
+                future_to_derivative = {
+                    executor.submit(self.upload_derivative, *derivative, force): derivative
+                    for derivative in derivatives
+                }
+                
+                derivative_count = 0
+                for future in as_completed(future_to_derivative):
+                    image_id, width, fmt, _ = future_to_derivative[future]
+                    try:
+                        success, message = future.result()
+                    except Exception as e:
+                        success, message = False, f"处理异常 {e}"
                     if success:
-                        success_count += 1
-                        print(f"✅ ({i}/{len(images)}) {image['id']}")
+                        derivative_count += 1
                     else:
-                        print(f"❌ ({i}/{len(images)}) {image['id']}: {message}")
-                except Exception as e:
-                    print(f"❌ ({i}/{len(images)}) {image['id']}: 处理异常 {e}")
+                        print(f"❌ {image_id} {width}w.{fmt}: {message}")
+                
+                print(f"✅ 派生图上传完成: {derivative_count}/{len(derivatives)} 成功")
         
-        print(f"✅ 批量上传完成: {success_count}/{len(images)} 成功")
         return success_count
     
     def sync_database_urls(self):
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+透明通道统计 - 用NumPy在去背景得到的蒙版上计算透明比例、主体边界框、边缘柔和度和碎片数量，
+按阈值拒绝失败的抠图，以及按主体边界框裁掉四周的透明区域
+"""
+
+import numpy as np
+from PIL import Image
+
+# 不超过该值视为完全透明，不低于OPAQUE_LEVEL视为完全不透明
+TRANSPARENT_LEVEL = 8
+OPAQUE_LEVEL = 247
+
+# 统计碎片时先把蒙版缩小到该最长边，连通域标记在小图上进行
+ISLAND_EDGE = 256
+
+# 小于该像素数（缩小后）的连通域视为噪点，不计入碎片
+MIN_ISLAND_PIXELS = 4
+
+# 计算画布边缘平均不透明度的边框宽度（占短边的比例）
+BORDER_RATIO = 0.02
+
+# 质量门槛的默认阈值，不满足时直接拒绝，不再编码和上传
+GATE_THRESHOLDS = {
+    'min_foreground': 0.01,
+    'max_foreground': 0.95,
+    'max_islands': 8,
+    'max_edge_alpha': 0.5,
+}
+
+# 裁剪到主体时四周保留的透明边距（像素）
+CROP_PADDING = 16
+
+def foreground_bbox(alpha, level=TRANSPARENT_LEVEL):
+    """可见像素的边界框 (left, top, right, bottom)，右下为开区间；全透明时返回None"""
+    visible = alpha > level
+    rows = np.flatnonzero(visible.any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(visible.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+def border_alpha(alpha, ratio=BORDER_RATIO):
+    """画布四周边框的平均不透明度（0-1），背景没有去掉时接近1"""
+    height, width = alpha.shape
+    band = max(1, int(min(height, width) * ratio))
+    parts = [alpha[:band], alpha[-band:], alpha[band:-band, :band], alpha[band:-band, -band:]]
+
+    total = sum(int(part.sum(dtype=np.uint64)) for part in parts)
+    count = sum(part.size for part in parts)
+    return total / count / 255 if count else 0.0
+
+def label_components(binary):
+    """四连通域标记：每个前景像素从唯一编号开始，反复取自身和四邻域的最小编号直到不再变化"""
+    height, width = binary.shape
+    background = height * width
+    labels = np.where(binary, np.arange(background).reshape(height, width), background)
+
+    while True:
+        neighbours = labels.copy()
+        np.minimum(neighbours[1:, :], labels[:-1, :], out=neighbours[1:, :])
+        np.minimum(neighbours[:-1, :], labels[1:, :], out=neighbours[:-1, :])
+        np.minimum(neighbours[:, 1:], labels[:, :-1], out=neighbours[:, 1:])
+        np.minimum(neighbours[:, :-1], labels[:, 1:], out=neighbours[:, :-1])
+        neighbours = np.where(binary, neighbours, background)
+
+        # 跳跃：把每个编号替换成该编号对应像素当前的编号，加快收敛
+        flat = neighbours.ravel()
+        foreground = flat < background
+        flat[foreground] = flat[flat[foreground]]
+
+        if np.array_equal(neighbours, labels):
+            return labels, background
+        labels = neighbours
+
+def count_islands(mask, min_pixels=MIN_ISLAND_PIXELS):
+    """主体被分成的不连通块数（在缩小的蒙版上统计，忽略噪点）"""
+    small = mask.copy()
+    small.thumbnail((ISLAND_EDGE, ISLAND_EDGE), Image.BILINEAR)
+    binary = np.asarray(small) >= 128
+    if not binary.any():
+        return 0
+
+    labels, background = label_components(binary)
+    _, sizes = np.unique(labels[labels < background], return_counts=True)
+    return int((sizes >= min_pixels).sum())
+
+def quality_score(foreground_ratio, islands, edge_softness):
+    """0-1的抠图质量估计：主体占比适中、碎片少、边缘不过分模糊"""
+    if islands == 0:
+        return 0.0
+
+    # 主体占画面5%-85%之间不扣分，越接近全空或全满分数越低
+    if foreground_ratio < 0.05:
+        coverage = foreground_ratio / 0.05
+    elif foreground_ratio > 0.85:
+        coverage = max(0.0, (1.0 - foreground_ratio) / 0.15)
+    else:
+        coverage = 1.0
+
+    fragments = 1.0 / (1.0 + 0.25 * (islands - 1))
+    edges = 1.0 - max(0.0, edge_softness - 0.3)
+
+    return round(coverage * fragments * edges, 3)
+
+def compute_alpha_stats(mask):
+    """蒙版（L模式图片）的统计信息"""
+    alpha = np.asarray(mask)
+    total = alpha.size
+
+    transparent = int((alpha <= TRANSPARENT_LEVEL).sum())
+    visible = total - transparent
+    partial = int(((alpha > TRANSPARENT_LEVEL) & (alpha < OPAQUE_LEVEL)).sum())
+
+    foreground_ratio = float((alpha >= 128).mean())
+    edge_softness = partial / visible if visible else 0.0
+    islands = count_islands(mask)
+
+    return {
+        'transparent_ratio': round(transparent / total, 4),
+        'foreground_ratio': round(foreground_ratio, 4),
+        'bbox': foreground_bbox(alpha),
+        'edge_softness': round(edge_softness, 4),
+        'island_count': islands,
+        'edge_alpha': round(border_alpha(alpha), 4),
+        'quality_score': quality_score(foreground_ratio, islands, edge_softness),
+    }
+
+def check_cutout(stats, thresholds=GATE_THRESHOLDS):
+    """按阈值检查抠图质量，返回拒绝原因，通过时返回None"""
+    foreground = stats['foreground_ratio']
+    if foreground < thresholds['min_foreground']:
+        return f"主体过小: 占比 {foreground}"
+    if foreground > thresholds['max_foreground']:
+        return f"背景未去除: 主体占比 {foreground}"
+    if stats['island_count'] > thresholds['max_islands']:
+        return f"主体碎片过多: {stats['island_count']} 块"
+    if stats['edge_alpha'] > thresholds['max_edge_alpha']:
+        return f"画布边缘不透明: 平均 {stats['edge_alpha']}"
+    return None
+
+def crop_cutout(image, bbox, padding=None):
+    """按主体边界框加边距裁剪抠图，padding为None或没有主体时不裁剪
+
+    返回 (图片, 几何信息)，几何信息记录输出尺寸、宽高比、在原画布中的偏移和原画布尺寸
+    """
+    canvas_width, canvas_height = image.size
+    left, top = 0, 0
+
+    if padding is not None and bbox:
+        left = max(0, bbox[0] - padding)
+        top = max(0, bbox[1] - padding)
+        right = min(canvas_width, bbox[2] + padding)
+        bottom = min(canvas_height, bbox[3] + padding)
+        if (right - left, bottom - top) != image.size:
+            image = image.crop((left, top, right, bottom))
+
+    width, height = image.size
+    return image, {
+        'cutout_width': width,
+        'cutout_height': height,
+        'aspect_ratio': f"{width}:{height}",
+        'crop_left': left,
+        'crop_top': top,
+        'canvas_width': canvas_width,
+        'canvas_height': canvas_height,
+    }
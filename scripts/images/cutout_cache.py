@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+抠图缓存 - 按内容寻址保存下载的原图和去背景蒙版，重新处理时跳过下载和推理
+"""
+
+import io
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+CUTOUT_CACHE_DIR = "cache/cutouts"
+
+# 缓存总大小上限，超过时按最近使用时间淘汰
+CUTOUT_CACHE_SIZE = 5 * 1024 * 1024 * 1024
+
+class CutoutCache:
+    """内容寻址的原图和蒙版缓存
+
+    文件按SHA-256存放在 objects/ 下，索引库记录每个对象的大小和最近使用时间，
+    以及原图URL到内容摘要的映射（重新处理时不需要下载就能得到原图）
+    """
+
+    def __init__(self, root=CUTOUT_CACHE_DIR, max_bytes=CUTOUT_CACHE_SIZE):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.db"
+        self.max_bytes = max_bytes
+
+        conn = self.connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sources (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_objects_last_used ON objects (last_used)")
+        conn.commit()
+        conn.close()
+
+    def connect(self):
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def mask_key(source_digest, model, params=None):
+        """蒙版的缓存键：原图内容摘要 + 模型名 + 影响蒙版的参数"""
+        payload = json.dumps([source_digest, model, params or {}], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def object_path(self, digest):
+        return self.objects_dir / digest[:2] / digest
+
+    def read_object(self, digest):
+        """读取对象并刷新最近使用时间，不存在时返回None"""
+        path = self.object_path(digest)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        conn = self.connect()
+        conn.execute("UPDATE objects SET last_used = ? WHERE digest = ?", (time.time(), digest))
+        conn.commit()
+        conn.close()
+        return data
+
+    def write_object(self, digest, kind, data):
+        """写入对象（先写临时文件再改名），然后按容量淘汰"""
+        path = self.object_path(digest)
+        path.parent.mkdir(exist_ok=True)
+        temp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        temp_path.write_bytes(data)
+        temp_path.replace(path)
+
+        conn = self.connect()
+        conn.execute('''
+            INSERT OR REPLACE INTO objects (digest, kind, size, last_used)
+            VALUES (?, ?, ?, ?)
+        ''', (digest, kind, len(data), time.time()))
+        conn.commit()
+        conn.close()
+
+        self.evict()
+
+    def get_source(self, url):
+        """按URL取缓存的原图，返回 (字节, 摘要)，没有时返回 (None, None)"""
+        conn = self.connect()
+        row = conn.execute("SELECT digest FROM sources WHERE url = ?", (url,)).fetchone()
+        conn.close()
+
+        if not row:
+            return None, None
+
+        data = self.read_object(row[0])
+        return (data, row[0]) if data is not None else (None, None)
+
+    def put_source(self, url, data):
+        """缓存原图，返回内容摘要"""
+        digest = self.digest(data)
+        self.write_object(digest, 'source', data)
+
+        conn = self.connect()
+        conn.execute("INSERT OR REPLACE INTO sources (url, digest) VALUES (?, ?)", (url, digest))
+        conn.commit()
+        conn.close()
+        return digest
+
+    def get_mask(self, key):
+        """取缓存的蒙版（L模式图片），没有时返回None"""
+        data = self.read_object(key)
+        if data is None:
+            return None
+
+        mask = Image.open(io.BytesIO(data))
+        mask.load()
+        return mask
+
+    def put_mask(self, key, mask):
+        """缓存蒙版，PNG快速压缩"""
+        buffer = io.BytesIO()
+        mask.save(buffer, 'PNG', compress_level=1)
+        self.write_object(key, 'mask', buffer.getvalue())
+
+    def evict(self):
+        """总大小超过上限时，按最近使用时间从旧到新删除对象"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        total = cursor.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total <= self.max_bytes:
+            conn.close()
+            return 0
+
+        evicted = []
+        for digest, size in cursor.execute("SELECT digest, size FROM objects ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.object_path(digest).unlink(missing_ok=True)
+            evicted.append((digest,))
+            total -= size
+
+        cursor.executemany("DELETE FROM objects WHERE digest = ?", evicted)
+        cursor.executemany("DELETE FROM sources WHERE digest = ?", evicted)
+        conn.commit()
+        conn.close()
+        return len(evicted)
+
+    def stats(self):
+        """缓存统计：各类对象的数量和大小"""
+        conn = self.connect()
+        rows = conn.execute("SELECT kind, COUNT(*), COALESCE(SUM(size), 0) FROM objects GROUP BY kind").fetchall()
+        conn.close()
+        return {kind: {'count': count, 'bytes': size} for kind, count, size in rows}
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+抠图编码 - PNG压缩级别、WebP无损/AVIF变体的并行编码，记录每种格式的耗时和大小，
+以及供srcset使用的多宽度派生图
+"""
+
+import io
+import time
+from pathlib import Path
+
+from PIL import Image, features
+
+# PNG压缩级别：流水线默认用fast，max（optimize穷举压缩）留给后台重新压缩
+PNG_LEVELS = {
+    'fast': {'compress_level': 1},
+    'default': {'compress_level': 6},
+    'max': {'optimize': True},
+}
+DEFAULT_PNG_LEVEL = 'fast'
+
+# 附加格式的编码参数
+VARIANT_FORMATS = {
+    # exact=False 允许编码器改写完全透明像素的RGB，压缩率更高
+    'webp': ('WEBP', {'lossless': True, 'method': 4, 'exact': False}),
+    'avif': ('AVIF', {'quality': 80, 'speed': 6}),
+}
+
+# 响应式图片（srcset）的宽度阶梯，只生成比抠图窄的宽度
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DERIVATIVE_FORMAT = 'webp'
+
+def avif_available():
+    """AVIF编码是否可用：Pillow 11.3+ 内置，或安装了 pillow-avif-plugin"""
+    if features.check('avif'):
+        return True
+    try:
+        import pillow_avif  # noqa: F401 注册AVIF插件
+        return True
+    except ImportError:
+        return False
+
+def check_formats(formats):
+    """过滤掉当前环境不支持的附加格式"""
+    supported = []
+    for fmt in formats:
+        if fmt not in VARIANT_FORMATS:
+            print(f"⚠️ 未知格式: {fmt}")
+        elif fmt == 'avif' and not avif_available():
+            print("⚠️ AVIF编码不可用，跳过: pip install pillow-avif-plugin")
+        else:
+            supported.append(fmt)
+    return supported
+
+def encode_image(image, fmt, png_level=DEFAULT_PNG_LEVEL):
+    """编码为指定格式，返回 (字节, 耗时毫秒)"""
+    buffer = io.BytesIO()
+    started = time.perf_counter()
+
+    if fmt == 'png':
+        image.save(buffer, 'PNG', **PNG_LEVELS[png_level])
+    else:
+        name, options = VARIANT_FORMATS[fmt]
+        image.save(buffer, name, **options)
+
+    return buffer.getvalue(), (time.perf_counter() - started) * 1000
+
+def write_variants(image, png_path, formats=(), png_level=DEFAULT_PNG_LEVEL, executor=None):
+    """从同一张已解码的抠图编码PNG和各附加格式并写入文件
+
+    附加格式与PNG同名、扩展名不同。传入executor时各格式并行编码（Pillow编码时释放GIL）。
+    返回每种格式的记录 {'format', 'path', 'bytes', 'encode_ms', 'optimized'}
+    """
+    image.load()
+
+    def encode(fmt):
+        data, elapsed = encode_image(image, fmt, png_level)
+        path = Path(png_path).with_suffix(f'.{fmt}')
+        path.write_bytes(data)
+        return {
+            'format': fmt,
+            'path': str(path),
+            'bytes': len(data),
+            'encode_ms': round(elapsed, 1),
+            'optimized': fmt != 'png' or png_level == 'max',
+        }
+
+    formats = ['png'] + [fmt for fmt in formats if fmt != 'png']
+    if executor and len(formats) > 1:
+        return list(executor.map(encode, formats))
+    return [encode(fmt) for fmt in formats]
+
+def derivative_path(png_path, width, fmt=DERIVATIVE_FORMAT):
+    """派生图路径：与PNG同目录，命名为 {图片ID}_{宽度}w.{格式}"""
+    png_path = Path(png_path)
+    return png_path.with_name(f"{png_path.stem}_{width}w.{fmt}")
+
+def write_derivatives(image, png_path, widths=DERIVATIVE_WIDTHS, fmt=DERIVATIVE_FORMAT,
+                      png_level=DEFAULT_PNG_LEVEL, executor=None):
+    """从同一张内存中的抠图按宽度阶梯缩小、编码并写入文件，不放大
+
+    从宽到窄依次缩小，每一级从上一级缩小，不需要每次都从全尺寸开始。
+    返回每个宽度的记录 {'width', 'height', 'format', 'path', 'bytes', 'encode_ms'}
+    """
+    image.load()
+
+    derivatives = []
+    source = image
+    for width in sorted({width for width in widths if width < image.width}, reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        source = source.resize((width, height), Image.LANCZOS)
+        derivatives.append(source)
+
+    def encode(derivative):
+        data, elapsed = encode_image(derivative, fmt, png_level)
+        path = derivative_path(png_path, derivative.width, fmt)
+        path.write_bytes(data)
+        return {
+            'width': derivative.width,
+            'height': derivative.height,
+            'format': fmt,
+            'path': str(path),
+            'bytes': len(data),
+            'encode_ms': round(elapsed, 1),
+        }
+
+    if executor and len(derivatives) > 1:
+        return list(executor.map(encode, derivatives))
+    return [encode(derivative) for derivative in derivatives]
+
+def recompress_png(path, previous_size=None):
+    """用最高压缩重新编码PNG，只在变小时替换文件，返回 (当前字节数, 耗时毫秒)"""
+    path = Path(path)
+    with Image.open(path) as image:
+        image.load()
+        data, elapsed = encode_image(image, 'png', 'max')
+
+    size = previous_size or path.stat().st_size
+    if len(data) < size:
+        temp_path = path.with_suffix('.png.tmp')
+        temp_path.write_bytes(data)
+        temp_path.replace(path)
+        size = len(data)
+
+    return size, elapsed
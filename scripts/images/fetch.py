@@ -5,23 +5,279 @@
 
 import os
 import sys
-import requests
 import sqlite3
 import json
 import time
 import argparse
+import hashlib
+import math
+import queue
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import urlsplit, urlencode
 from dotenv import load_dotenv
 
+# 添加项目根目录到路径
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from scripts.utils.http_client import RETRY_STATUSES, get_api_session
+
 # 加载环境变量
 load_dotenv()
 
+# 搜索接口地址（基准测试时指向本地桩服务器）
+API_ENDPOINTS = {
+    'unsplash': "https://api.unsplash.com/search/photos",
+    'pixabay': "https://pixabay.com/api/",
+}
+
+# 各平台API配额: (窗口内请求数, 窗口秒数)
+# Unsplash Demo应用为50次/小时，Production应用为5000次/小时
+# Pixabay为100次/60秒
+RATE_LIMITS = {
+    'unsplash': (int(os.getenv('UNSPLASH_REQUESTS_PER_HOUR', 50)), 3600),
+    'pixabay': (int(os.getenv('PIXABAY_REQUESTS_PER_MINUTE', 100)), 60),
+}
+
+# 每页数量固定，保证游标记录的页码在多次运行之间含义一致
+PER_PAGE = {
+    'unsplash': 30,   # Unsplash每页最多30张
+    'pixabay': 100,   # Pixabay每页3-200张，最多可访问500张
+}
+
+# 连续多少页没有新图片后停止翻页该关键词
+MAX_EMPTY_PAGES = 3
+
+# 未指定请求配额时，按目标数量所需页数的倍数估算
+DEFAULT_BUDGET_FACTOR = 3
+
+# 每累积多少张新图片提交一次数据库
+CHUNK_SIZE = 100
+
+# 并发模式下等待写入的页数上限，超出时抓取线程阻塞
+MAX_PENDING_PAGES = 32
+
+# 搜索结果缓存：新鲜期内直接使用（Pixabay要求结果缓存24小时），过期后带ETag重新验证
+CACHE_PATH = "cache/api_cache.db"
+CACHE_TTL = 24 * 3600
+CACHE_RETENTION = 7 * 24 * 3600
+
+# API请求遇到429/5xx时的重试次数和退避基数（秒），每次重试都重新获取令牌
+API_RETRIES = 3
+API_BACKOFF = 0.5
+
+# 不参与缓存键的认证参数
+AUTH_PARAMS = {'key', 'client_id'}
+
+class TokenBucket:
+    """令牌桶限流器（线程安全）
+    
+    桶初始是满的，任意一个period内最多发放 容量 + 补充速率 × period 个令牌，
+    所以补充速率按配额减去容量计算，保证任何窗口内都不超过limit
+    """
+    
+    def __init__(self, limit, period, burst=None):
+        # 桶容量即允许的突发量，至少给补充留出一个令牌
+        self.capacity = min(burst or max(1, min(10, limit // 10)), max(1, limit - 1))
+        self.rate = max(1, limit - self.capacity) / period  # 每秒补充的令牌数
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, cancel=None):
+        """获取一个令牌，没有可用令牌时阻塞等待；cancel事件被设置时抛出FetchCancelled"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            
+            if cancel is None:
+                time.sleep(wait)
+            elif cancel.wait(wait):
+                raise FetchCancelled("获取已取消")
+
+class CacheMiss(Exception):
+    """离线模式下缓存中没有对应响应"""
+
+class FetchCancelled(Exception):
+    """并发获取被中断，抓取线程停止等待令牌"""
+
+class ResponseCache:
+    """API搜索结果的磁盘缓存（SQLite），按规范化的URL和参数索引"""
+    
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        
+        conn = sqlite3.connect(self.path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def normalize(url, params=None):
+        """规范化URL：主机名小写、参数排序、去掉认证参数"""
+        parts = urlsplit(url)
+        query = sorted(
+            (str(k), str(v)) for k, v in (params or {}).items()
+            if k not in AUTH_PARAMS
+        )
+        base = f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path}"
+        return f"{base}?{urlencode(query)}" if query else base
+    
+    @staticmethod
+    def make_key(normalized_url):
+        return hashlib.sha256(normalized_url.encode('utf-8')).hexdigest()
+    
+    def get(self, url, params=None):
+        """返回缓存条目（含是否新鲜），没有时返回None"""
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT * FROM responses WHERE key = ?",
+            (self.make_key(self.normalize(url, params)),)
+        )
+        row = cursor.fetchone()
+        conn.close()
+        
+        if not row:
+            return None
+        
+        entry = dict(row)
+        entry['fresh'] = time.time() - entry['fetched_at'] < self.ttl
+        return entry
+    
+    def set(self, url, params, body, etag=None, last_modified=None):
+        """写入或刷新缓存条目"""
+        normalized = self.normalize(url, params)
+        conn = sqlite3.connect(self.path)
+        conn.execute('''
+            INSERT OR REPLACE INTO responses (key, url, body, etag, last_modified, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (self.make_key(normalized), normalized, body, etag, last_modified, time.time()))
+        conn.commit()
+        conn.close()
+    
+    def touch(self, url, params=None):
+        """304重新验证成功后刷新条目时间"""
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "UPDATE responses SET fetched_at = ? WHERE key = ?",
+            (time.time(), self.make_key(self.normalize(url, params)))
+        )
+        conn.commit()
+        conn.close()
+    
+    def purge(self, max_age=CACHE_RETENTION):
+        """删除超过保留期的条目"""
+        conn = sqlite3.connect(self.path)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM responses WHERE fetched_at < ?", (time.time() - max_age,))
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return deleted
+
+class KeywordScheduler:
+    """按关键词的可用新图片产出率分配每次运行的请求配额，并保留一部分用于探索"""
+    
+    def __init__(self, stats, exploration=0.2):
+        self.stats = stats  # {关键词: {'requests', 'new_images', 'usable'}}
+        self.exploration = exploration
+    
+    def score(self, keyword):
+        """估算每次请求能得到的可用新图片数"""
+        stat = self.stats.get(keyword, {})
+        requests_made = stat.get('requests', 0)
+        new_images = stat.get('new_images', 0)
+        usable = stat.get('usable', 0)
+        
+        # 平均每次请求的新图片数（加1平滑，未请求过的关键词按乐观值估计）
+        new_rate = (new_images + 1) / (requests_made + 1)
+        # 新图片通过去背景处理的比例（Beta(1,1)先验），统计不一致时（如旧数据库清空过游标）不超过1
+        pass_rate = min(1.0, (usable + 1) / (new_images + 2))
+        return new_rate * pass_rate
+    
+    def allocate(self, candidates, budget):
+        """把budget次请求分配给candidates [(分类, 关键词)]
+        
+        返回按得分从高到低排序的 {(分类, 关键词): 页数}
+        """
+        if not candidates or budget <= 0:
+            return {}
+        
+        allocation = {candidate: 0 for candidate in candidates}
+        
+        # 探索：每个关键词一页，优先分给请求次数最少的关键词
+        explore = min(len(candidates), max(1, round(budget * self.exploration)))
+        least_tried = sorted(candidates, key=lambda c: self.stats.get(c[1], {}).get('requests', 0))
+        for candidate in least_tried[:explore]:
+            allocation[candidate] += 1
+        
+        # 利用：剩余配额按得分比例分配（最大余数法）
+        remaining = budget - explore
+        scores = {candidate: self.score(candidate[1]) for candidate in candidates}
+        total = sum(scores.values())
+        shares = {candidate: remaining * scores[candidate] / total for candidate in candidates}
+        
+        for candidate, share in shares.items():
+            allocation[candidate] += int(share)
+        
+        leftover = remaining - sum(int(share) for share in shares.values())
+        by_remainder = sorted(candidates, key=lambda c: shares[c] - int(shares[c]), reverse=True)
+        for candidate in by_remainder[:leftover]:
+            allocation[candidate] += 1
+        
+        ordered = sorted(candidates, key=lambda c: scores[c], reverse=True)
+        return {candidate: allocation[candidate] for candidate in ordered if allocation[candidate]}
+
 class ImageFetcher:
-    def __init__(self):
+    def __init__(self, use_cache=True, offline=False, cache_ttl=CACHE_TTL):
         self.db_path = "images.db"
         self.unsplash_key = os.getenv('UNSPLASH_ACCESS_KEY')
         self.pixabay_key = os.getenv('PIXABAY_API_KEY')
+        self.endpoints = dict(API_ENDPOINTS)
+        self.session = get_api_session()
+        
+        # 搜索结果缓存；离线模式只从缓存回放，忽略过期时间
+        self.offline = offline
+        self.cache = ResponseCache(ttl=cache_ttl) if use_cache or offline else None
+        
+        # 每个API主机独立限流
+        self.rate_limiters = {
+            source: TokenBucket(limit, period)
+            for source, (limit, period) in RATE_LIMITS.items()
+        }
+        
+        # 并发获取被中断时通知抓取线程停止
+        self.cancel = threading.Event()
+        
+        # 已存在图片ID的内存索引，首次查询时从数据库一次性加载
+        self.known_ids = None
+        
+        # 每个(来源, 关键词)的翻页游标
+        self.cursors = {}
+        self.lock = threading.Lock()
         
         # 高质量关键词库
         self.keywords = {
@@ -54,218 +310,516 @@ class ImageFetcher:
                 source TEXT,
                 created_at TEXT,
                 processed BOOLEAN DEFAULT FALSE,
-                uploaded BOOLEAN DEFAULT FALSE
+                uploaded BOOLEAN DEFAULT FALSE,
+                keyword TEXT
+            )
+        ''')
+        
+        # 旧数据库补充关键词列，用于统计每个关键词的产出
+        cursor.execute("PRAGMA table_info(images)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if 'keyword' not in columns:
+            cursor.execute("ALTER TABLE images ADD COLUMN keyword TEXT")
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fetch_cursors (
+                source TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                last_page INTEGER DEFAULT 0,
+                total_pages INTEGER,
+                requests INTEGER DEFAULT 0,
+                new_images INTEGER DEFAULT 0,
+                empty_pages INTEGER DEFAULT 0,
+                exhausted BOOLEAN DEFAULT FALSE,
+                updated_at TEXT,
+                PRIMARY KEY (source, keyword)
             )
         ''')
         
         conn.commit()
         conn.close()
     
-    def image_exists(self, image_id):
-        """检查图片是否已存在"""
+    def load_cursors(self):
+        """加载所有关键词的翻页游标"""
         conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute("SELECT id FROM images WHERE id = ?", (image_id,))
-        exists = cursor.fetchone() is not None
+        cursor.execute("SELECT * FROM fetch_cursors")
+        self.cursors = {(row['source'], row['keyword']): dict(row) for row in cursor}
         conn.close()
-        return exists
+        return len(self.cursors)
     
-    def fetch_from_unsplash(self, count=50):
-        """从Unsplash获取图片"""
-        if not self.unsplash_key:
-            print("❌ 未配置Unsplash API密钥")
-            return []
+    def get_cursor(self, source, keyword):
+        """获取关键词游标，不存在时返回初始状态"""
+        return self.cursors.setdefault((source, keyword), {
+            'source': source,
+            'keyword': keyword,
+            'last_page': 0,
+            'total_pages': None,
+            'requests': 0,
+            'new_images': 0,
+            'empty_pages': 0,
+            'exhausted': False,
+            'updated_at': None
+        })
+    
+    def update_cursor(self, source, keyword, page, total_pages, new_count, collected, completed=True):
+        """在内存中记录一次翻页结果，返回游标快照（与图片一起提交到数据库）
+        
+        new_count为本页未见过的图片数，collected为实际收集的数量。
+        completed为False表示本页因数量已满未完全消费，游标不前进，下次运行重新读取该页
+        """
+        with self.lock:
+            state = self.get_cursor(source, keyword)
+            state['requests'] += 1
+            state['total_pages'] = total_pages
+            state['new_images'] += collected
+            
+            if completed:
+                state['last_page'] = page
+                state['empty_pages'] = 0 if new_count else state['empty_pages'] + 1
+                state['exhausted'] = (
+                    state['empty_pages'] >= MAX_EMPTY_PAGES
+                    or (total_pages is not None and page >= total_pages)
+                )
+            
+            state['updated_at'] = datetime.now().isoformat()
+            return dict(state)
+    
+    def reset_cursors(self):
+        """重置所有翻页游标，下次从第1页重新开始
+        
+        只清空翻页位置，保留各关键词累计的请求数和新图片数：调度器的处理通过率按images表中
+        该关键词的全部图片统计，两者必须覆盖同样的历史
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE fetch_cursors
+            SET last_page = 0, total_pages = NULL, empty_pages = 0, exhausted = FALSE, updated_at = ?
+        """, (datetime.now().isoformat(),))
+        reset = cursor.rowcount
+        conn.commit()
+        conn.close()
+        self.load_cursors()
+        return reset
+    
+    def load_keyword_stats(self, source):
+        """统计来源下每个关键词的请求数、新图片数和处理成功（可用）数"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        stats = {}
+        cursor.execute(
+            "SELECT keyword, requests, new_images FROM fetch_cursors WHERE source = ?",
+            (source,)
+        )
+        for keyword, requests_made, new_images in cursor.fetchall():
+            stats[keyword] = {'requests': requests_made, 'new_images': new_images, 'usable': 0}
+        
+        cursor.execute("""
+            SELECT keyword, COUNT(*) FROM images
+            WHERE source = ? AND keyword IS NOT NULL AND processed = TRUE
+            GROUP BY keyword
+        """, (source,))
+        for keyword, usable in cursor.fetchall():
+            stats.setdefault(keyword, {'requests': 0, 'new_images': 0})['usable'] = usable
+        
+        conn.close()
+        return stats
+    
+    def plan_requests(self, source, count, budget=None):
+        """用调度器为本次运行分配各关键词的请求页数"""
+        if budget is None:
+            budget = math.ceil(count / PER_PAGE[source]) * DEFAULT_BUDGET_FACTOR
+        
+        candidates = [
+            (category, keyword)
+            for category, keywords in self.keywords.items()
+            for keyword in keywords
+            if not self.get_cursor(source, keyword)['exhausted']
+        ]
+        
+        scheduler = KeywordScheduler(self.load_keyword_stats(source))
+        plan = scheduler.allocate(candidates, budget)
+        
+        print(f"📊 {source.title()}请求配额 {budget} 次，分配给 {len(plan)} 个关键词")
+        return plan
+    
+    def load_known_ids(self):
+        """一次性加载数据库中所有图片ID到内存索引"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM images")
+        self.known_ids = {row[0] for row in cursor}
+        conn.close()
+        return len(self.known_ids)
+    
+    def image_exists(self, image_id):
+        """检查图片是否已存在（内存索引，不访问数据库）"""
+        if self.known_ids is None:
+            self.load_known_ids()
+        return image_id in self.known_ids
+    
+    def api_get(self, source, url, params, headers=None):
+        """带缓存和限流的API GET请求，返回解析后的JSON"""
+        entry = self.cache.get(url, params) if self.cache else None
+        
+        if entry and (entry['fresh'] or self.offline):
+            return json.loads(entry['body'])
+        if self.offline:
+            raise CacheMiss(f"离线模式缓存未命中: {ResponseCache.normalize(url, params)}")
+        
+        headers = dict(headers or {})
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        
+        # 429/5xx由这里退避重试，每次发送前都获取令牌，重试的请求同样计入配额
+        for attempt in range(API_RETRIES + 1):
+            self.rate_limiters[source].acquire(self.cancel)
+            response = self.session.get(url, headers=headers, params=params)
+            if response.status_code not in RETRY_STATUSES or attempt == API_RETRIES:
+                break
+            
+            retry_after = response.headers.get('Retry-After', '')
+            if self.cancel.wait(float(retry_after) if retry_after.isdigit() else API_BACKOFF * 2 ** attempt):
+                raise FetchCancelled("获取已取消")
+        
+        if response.status_code == 304 and entry:
+            self.cache.touch(url, params)
+            return json.loads(entry['body'])
+        
+        response.raise_for_status()
+        
+        if self.cache:
+            self.cache.set(url, params, response.text,
+                           response.headers.get('ETag'),
+                           response.headers.get('Last-Modified'))
+        
+        return response.json()
+    
+    def search_unsplash(self, category, keyword, page=1):
+        """搜索Unsplash单个关键词的一页，返回 (解析后的图片数据, 总页数)"""
+        url = self.endpoints['unsplash']
+        params = {
+            'query': keyword,
+            'page': page,
+            'per_page': PER_PAGE['unsplash'],
+            'orientation': 'all',
+            'order_by': 'popular'
+        }
+        headers = {'Authorization': f'Client-ID {self.unsplash_key}'}
+        
+        data = self.api_get('unsplash', url, params, headers)
         
         images = []
-        per_page = min(30, count)  # Unsplash限制每页最多30张
+        for item in data.get('results', []):
+            # 生成标签
+            tags = [keyword, category]
+            if item.get('tags'):
+                tags.extend([tag['title'] for tag in item['tags'][:5]])
+            
+            images.append({
+                'id': f"unsplash_{item['id']}",
+                'title': f"{keyword.title()} Image",
+                'description': item.get('description') or item.get('alt_description', ''),
+                'tags': json.dumps(list(set(tags))),
+                'url_thumbnail': item['urls']['thumb'],
+                'url_regular': item['urls']['regular'],
+                'width': item['width'],
+                'height': item['height'],
+                'likes': item['likes'],
+                'author': item['user']['name'],
+                'author_url': item['user']['links']['html'],
+                'source': 'unsplash',
+                'keyword': keyword,
+                'created_at': datetime.now().isoformat()
+            })
         
-        for category, keywords in self.keywords.items():
-            for keyword in keywords[:2]:  # 每个分类取前2个关键词
-                if len(images) >= count:
-                    break
+        return images, data.get('total_pages')
+    
+    def search_pixabay(self, category, keyword, page=1):
+        """搜索Pixabay单个关键词的一页，返回 (解析后的图片数据, 总页数)"""
+        url = self.endpoints['pixabay']
+        params = {
+            'key': self.pixabay_key,
+            'q': keyword,
+            'image_type': 'photo',
+            'orientation': 'all',
+            'min_width': 1920,
+            'min_height': 1080,
+            'page': page,
+            'per_page': PER_PAGE['pixabay'],
+            'safesearch': 'true',
+            'order': 'popular'
+        }
+        
+        data = self.api_get('pixabay', url, params)
+        
+        images = []
+        for item in data.get('hits', []):
+            # 生成标签
+            tags = [keyword, category]
+            if item.get('tags'):
+                tags.extend(item['tags'].split(', ')[:5])
+            
+            images.append({
+                'id': f"pixabay_{item['id']}",
+                'title': f"{keyword.title()} {category.title()} Image",
+                'description': f"High-quality {keyword} image from Pixabay",
+                'tags': json.dumps(list(set(tags))),
+                'url_thumbnail': item['previewURL'],
+                'url_regular': item['largeImageURL'],
+                'width': item['imageWidth'],
+                'height': item['imageHeight'],
+                'likes': item['likes'],
+                'author': item['user'],
+                'author_url': f"https://pixabay.com/users/{item['user']}-{item['user_id']}/",
+                'source': 'pixabay',
+                'keyword': keyword,
+                'created_at': datetime.now().isoformat()
+            })
+        
+        # totalHits为API可访问的结果数（最多500）
+        total_pages = -(-data.get('totalHits', 0) // PER_PAGE['pixabay'])
+        return images, total_pages
+    
+    def get_searcher(self, source):
+        """返回 (API密钥, 搜索函数)"""
+        return {
+            'unsplash': (self.unsplash_key, self.search_unsplash),
+            'pixabay': (self.pixabay_key, self.search_pixabay),
+        }[source]
+    
+    def fetch_next_page(self, source, category, keyword, counts, quota):
+        """按游标获取关键词的下一页
+        
+        counts为各来源已收集数量（多线程共享），达到quota后不再收集。
+        返回 (本页收集的新图片, 游标快照)
+        """
+        state = self.get_cursor(source, keyword)
+        page = state['last_page'] + 1
+        _, search = self.get_searcher(source)
+        images, total_pages = search(category, keyword, page)
+        
+        new_count = 0
+        collected = []
+        completed = True
+        for image_data in images:
+            with self.lock:
+                if self.image_exists(image_data['id']):
+                    continue
+                new_count += 1
                 
-                try:
-                    url = f"https://api.unsplash.com/search/photos"
-                    params = {
-                        'query': keyword,
-                        'per_page': min(per_page, count - len(images)),
-                        'orientation': 'all',
-                        'order_by': 'popular'
-                    }
-                    headers = {'Authorization': f'Client-ID {self.unsplash_key}'}
-                    
-                    response = requests.get(url, headers=headers, params=params)
-                    response.raise_for_status()
-                    
-                    data = response.json()
-                    
-                    for item in data.get('results', []):
-                        if len(images) >= count:
-                            break
-                        
-                        image_id = f"unsplash_{item['id']}"
-                        
-                        if self.image_exists(image_id):
-                            continue
-                        
-                        # 生成标签
-                        tags = [keyword, category]
-                        if item.get('tags'):
-                            tags.extend([tag['title'] for tag in item['tags'][:5]])
-                        
-                        image_data = {
-                            'id': image_id,
-                            'title': f"{keyword.title()} Image",
-                            'description': item.get('description') or item.get('alt_description', ''),
-                            'tags': json.dumps(list(set(tags))),
-                            'url_thumbnail': item['urls']['thumb'],
-                            'url_regular': item['urls']['regular'],
-                            'width': item['width'],
-                            'height': item['height'],
-                            'likes': item['likes'],
-                            'author': item['user']['name'],
-                            'author_url': item['user']['links']['html'],
-                            'source': 'unsplash',
-                            'created_at': datetime.now().isoformat()
-                        }
-                        
-                        images.append(image_data)
-                    
-                    time.sleep(1)  # API限制
-                    
-                except Exception as e:
-                    print(f"❌ Unsplash获取失败 {keyword}: {e}")
+                if counts[source] >= quota:
+                    completed = False
                     continue
+                
+                # 加入已知索引，避免其他关键词重复收集同一张图片
+                self.known_ids.add(image_data['id'])
+                counts[source] += 1
+            
+            collected.append(image_data)
         
-        return images
+        cursor_row = self.update_cursor(source, keyword, page, total_pages,
+                                        new_count, len(collected), completed)
+        return collected, cursor_row
     
-    def fetch_from_pixabay(self, count=50):
-        """从Pixabay获取图片"""
-        if not self.pixabay_key:
-            print("❌ 未配置Pixabay API密钥")
-            return []
+    def iter_source(self, source, count, counts, budget=None):
+        """逐页产出指定来源的 (新图片, 游标快照)：按调度器分配的页数轮流翻页，直到数量满足或配额用完"""
+        api_key, _ = self.get_searcher(source)
+        if not api_key:
+            print(f"❌ 未配置{source.title()} API密钥")
+            return
         
-        images = []
-        per_page = min(200, count)  # Pixabay最多200张
+        print(f"📸 从{source.title()}获取图片...")
+        plan = self.plan_requests(source, count, budget)
         
-        for category, keywords in self.keywords.items():
-            for keyword in keywords[:2]:
-                if len(images) >= count:
+        while plan and counts[source] < count:
+            for category, keyword in list(plan):
+                if counts[source] >= count:
                     break
                 
                 try:
-                    url = "https://pixabay.com/api/"
-                    params = {
-                        'key': self.pixabay_key,
-                        'q': keyword,
-                        'image_type': 'photo',
-                        'orientation': 'all',
-                        'min_width': 1920,
-                        'min_height': 1080,
-                        'per_page': min(per_page, count - len(images)),
-                        'safesearch': 'true',
-                        'order': 'popular'
-                    }
-                    
-                    response = requests.get(url, params=params)
-                    response.raise_for_status()
-                    
-                    data = response.json()
-                    
-                    for item in data.get('hits', []):
-                        if len(images) >= count:
-                            break
-                        
-                        image_id = f"pixabay_{item['id']}"
-                        
-                        if self.image_exists(image_id):
-                            continue
-                        
-                        # 生成标签
-                        tags = [keyword, category]
-                        if item.get('tags'):
-                            tags.extend(item['tags'].split(', ')[:5])
-                        
-                        image_data = {
-                            'id': image_id,
-                            'title': f"{keyword.title()} {category.title()} Image",
-                            'description': f"High-quality {keyword} image from Pixabay",
-                            'tags': json.dumps(list(set(tags))),
-                            'url_thumbnail': item['previewURL'],
-                            'url_regular': item['largeImageURL'],
-                            'width': item['imageWidth'],
-                            'height': item['imageHeight'],
-                            'likes': item['likes'],
-                            'author': item['user'],
-                            'author_url': f"https://pixabay.com/users/{item['user']}-{item['user_id']}/",
-                            'source': 'pixabay',
-                            'created_at': datetime.now().isoformat()
-                        }
-                        
-                        images.append(image_data)
-                    
-                    time.sleep(1)  # API限制
-                    
+                    collected, cursor_row = self.fetch_next_page(source, category, keyword, counts, count)
+                    has_more = not cursor_row['exhausted']
+                    yield collected, cursor_row
                 except Exception as e:
-                    print(f"❌ Pixabay获取失败 {keyword}: {e}")
+                    print(f"❌ {source.title()}获取失败 {keyword}: {e}")
+                    has_more = False
+                
+                plan[(category, keyword)] -= 1
+                if not has_more or not plan[(category, keyword)]:
+                    del plan[(category, keyword)]
+    
+    def iter_concurrent(self, quotas, counts, max_workers=8, budget=None):
+        """并发获取：所有来源、所有已分配配额的关键词同时翻页，按主机令牌桶限流
+        
+        quotas: {来源: 目标数量}。每个来源使用独立的线程池（平分max_workers），
+        等待某个来源的令牌时不会占用其他来源的线程。抓取线程通过有界队列把每页结果交给调用方，队列满时阻塞。
+        调用方停止读取（中断或异常）时设置self.cancel，抓取线程不再等待队列和令牌，线程池随即退出
+        """
+        tasks = {}
+        for source in quotas:
+            api_key, _ = self.get_searcher(source)
+            if not api_key:
+                print(f"❌ 未配置{source.title()} API密钥")
+                continue
+            tasks[source] = [
+                (source, category, keyword, pages)
+                for (category, keyword), pages in self.plan_requests(source, quotas[source], budget).items()
+            ]
+        
+        pages_queue = queue.Queue(maxsize=MAX_PENDING_PAGES)
+        done = object()
+        self.cancel.clear()
+        
+        def put(item):
+            """放入队列，已取消时放弃，返回是否放入"""
+            while not self.cancel.is_set():
+                try:
+                    pages_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
                     continue
+            return False
         
-        return images
+        def run_task(source, category, keyword, pages):
+            try:
+                for _ in range(pages):
+                    if counts[source] >= quotas[source] or self.cancel.is_set():
+                        break
+                    collected, cursor_row = self.fetch_next_page(source, category, keyword,
+                                                                 counts, quotas[source])
+                    if not put((collected, cursor_row)) or cursor_row['exhausted']:
+                        break
+            except FetchCancelled:
+                pass
+            except Exception as e:
+                print(f"❌ {source.title()}获取失败 {keyword}: {e}")
+            finally:
+                put(done)
+        
+        workers_per_source = max(1, max_workers // max(1, len(tasks)))
+        executors = [ThreadPoolExecutor(max_workers=workers_per_source) for _ in tasks]
+        try:
+            for executor, source_tasks in zip(executors, tasks.values()):
+                for task in source_tasks:
+                    executor.submit(run_task, *task)
+            
+            remaining = sum(len(source_tasks) for source_tasks in tasks.values())
+            while remaining:
+                item = pages_queue.get()
+                if item is done:
+                    remaining -= 1
+                else:
+                    yield item
+        finally:
+            self.cancel.set()
+            for executor in executors:
+                executor.shutdown(cancel_futures=True)
     
-    def save_images(self, images):
-        """保存图片数据到数据库"""
-        if not images:
+    def save_images(self, images, cursor_rows=()):
+        """在一个事务中批量保存图片数据和对应的翻页游标"""
+        if not images and not cursor_rows:
             return 0
         
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        try:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO images 
+                (id, title, description, tags, url_thumbnail, url_regular, width, height, 
+                 likes, author, author_url, source, created_at, processed, uploaded, keyword)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                image['id'], image['title'], image['description'], image['tags'],
+                image['url_thumbnail'], image['url_regular'], image['width'], image['height'],
+                image['likes'], image['author'], image['author_url'], image['source'],
+                image['created_at'], False, False, image.get('keyword')
+            ) for image in images])
+            saved_count = max(cursor.rowcount, 0)
+            
+            cursor.executemany('''
+                INSERT OR REPLACE INTO fetch_cursors
+                (source, keyword, last_page, total_pages, requests, new_images,
+                 empty_pages, exhausted, updated_at)
+                VALUES (:source, :keyword, :last_page, :total_pages, :requests, :new_images,
+                        :empty_pages, :exhausted, :updated_at)
+            ''', list(cursor_rows))
+            
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ 保存图片失败（{len(images)} 张）: {e}")
+            
+            # 收集时已预先加入索引，事务回滚后移除，本次运行中仍可重新收集
+            if self.known_ids is not None:
+                with self.lock:
+                    self.known_ids.difference_update(image['id'] for image in images)
+            return 0
+        finally:
+            conn.close()
+        
+        # 只在提交成功后更新索引
+        if self.known_ids is not None:
+            with self.lock:
+                self.known_ids.update(image['id'] for image in images)
+        
+        return saved_count
+    
+    def ingest(self, pages, chunk_size=CHUNK_SIZE):
+        """消费逐页结果，每累积chunk_size张新图片提交一次（图片和游标在同一事务中）"""
         saved_count = 0
-        for image in images:
-            try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO images 
-                    (id, title, description, tags, url_thumbnail, url_regular, width, height, 
-                     likes, author, author_url, source, created_at, processed, uploaded)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    image['id'], image['title'], image['description'], image['tags'],
-                    image['url_thumbnail'], image['url_regular'], image['width'], image['height'],
-                    image['likes'], image['author'], image['author_url'], image['source'],
-                    image['created_at'], False, False
-                ))
-                saved_count += 1
-            except Exception as e:
-                print(f"❌ 保存图片失败 {image['id']}: {e}")
+        chunk = []
+        cursor_rows = {}
         
-        conn.commit()
-        conn.close()
+        for collected, cursor_row in pages:
+            chunk.extend(collected)
+            cursor_rows[(cursor_row['source'], cursor_row['keyword'])] = cursor_row
+            
+            if len(chunk) >= chunk_size:
+                saved_count += self.save_images(chunk, cursor_rows.values())
+                print(f"💾 已提交 {saved_count} 张新图片")
+                chunk = []
+                cursor_rows = {}
+        
+        saved_count += self.save_images(chunk, cursor_rows.values())
         return saved_count
     
-    def fetch_images(self, count=100, source="both"):
+    def fetch_images(self, count=100, source="both", concurrent=False, max_workers=8,
+                     budget=None, chunk_size=CHUNK_SIZE):
         """获取图片的主函数"""
         self.init_database()
+        known_count = self.load_known_ids()
+        self.load_cursors()
         
-        print(f"🚀 开始获取 {count} 张图片...")
+        if self.cache and not self.offline:
+            self.cache.purge()
         
-        all_images = []
+        print(f"🚀 开始获取 {count} 张图片（已有 {known_count} 张）...")
         
-        if source in ["unsplash", "both"]:
-            print("📸 从Unsplash获取图片...")
-            unsplash_count = count if source == "unsplash" else count // 2
-            unsplash_images = self.fetch_from_unsplash(unsplash_count)
-            all_images.extend(unsplash_images)
-            print(f"✅ Unsplash获取了 {len(unsplash_images)} 张图片")
+        sources = ["unsplash", "pixabay"] if source == "both" else [source]
+        quotas = {name: count // len(sources) for name in sources}
+        counts = {name: 0 for name in sources}
         
-        if source in ["pixabay", "both"]:
-            print("🎨 从Pixabay获取图片...")
-            pixabay_count = count if source == "pixabay" else count // 2
-            pixabay_images = self.fetch_from_pixabay(pixabay_count)
-            all_images.extend(pixabay_images)
-            print(f"✅ Pixabay获取了 {len(pixabay_images)} 张图片")
+        if concurrent:
+            print(f"⚡ 并发获取模式 ({max_workers} 线程)...")
+            pages = self.iter_concurrent(quotas, counts, max_workers, budget)
+        else:
+            pages = (
+                page
+                for name in sources
+                for page in self.iter_source(name, quotas[name], counts, budget)
+            )
+        
+        saved_count = self.ingest(pages, chunk_size)
         
-        # 保存到数据库
-        saved_count = self.save_images(all_images)
+        for name in sources:
+            print(f"✅ {name.title()}获取了 {counts[name]} 张图片")
         
         print(f"💾 成功保存 {saved_count} 张新图片到数据库")
         return saved_count
@@ -275,11 +829,29 @@ def main():
     parser.add_argument("--count", type=int, default=100, help="获取图片数量")
     parser.add_argument("--source", choices=["unsplash", "pixabay", "both"], 
                        default="both", help="图片来源")
+    parser.add_argument("--concurrent", action="store_true", help="并发查询所有来源和关键词")
+    parser.add_argument("--workers", type=int, default=8, help="并发请求线程数")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="每多少张新图片提交一次数据库")
+    parser.add_argument("--budget", type=int, help="每个来源本次最多请求次数（默认按数量估算）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用API响应缓存")
+    parser.add_argument("--offline", action="store_true", help="离线模式，只从缓存回放API响应")
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL / 3600, help="缓存新鲜期（小时）")
+    parser.add_argument("--reset-cursors", action="store_true", help="重置翻页游标，从第1页重新开始（保留关键词统计）")
     
     args = parser.parse_args()
     
-    fetcher = ImageFetcher()
-    fetcher.fetch_images(args.count, args.source)
+    fetcher = ImageFetcher(
+        use_cache=not args.no_cache,
+        offline=args.offline,
+        cache_ttl=args.cache_ttl * 3600
+    )
+    
+    if args.reset_cursors:
+        fetcher.init_database()
+        print(f"🔄 已重置 {fetcher.reset_cursors()} 个关键词游标")
+    
+    fetcher.fetch_images(args.count, args.source, args.concurrent, args.workers,
+                         args.budget, args.chunk_size)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
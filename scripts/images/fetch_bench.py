@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+图片获取基准测试 - 录制API响应、本地桩服务器回放、测量获取吞吐量
+"""
+
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+# 添加项目根目录到路径
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from scripts.images.fetch import API_ENDPOINTS, PER_PAGE, ImageFetcher, ResponseCache, TokenBucket
+
+FIXTURES_DIR = Path("fixtures/fetch")
+
+# 合成数据：每个关键词的总页数，以及各关键词共享的热门图片比例（用于产生重复）
+SYNTHETIC_PAGES = 20
+SYNTHETIC_SHARED_RATIO = 0.2
+
+def load_fixtures(fixtures_dir=FIXTURES_DIR):
+    """加载录制的响应，返回 {缓存键: 响应JSON文本}"""
+    fixtures = {}
+    for path in Path(fixtures_dir).glob("*/*.json"):
+        with open(path) as f:
+            fixture = json.load(f)
+        fixtures[ResponseCache.make_key(fixture['url'])] = json.dumps(fixture['body'])
+    return fixtures
+
+def export_cache(cache_path, fixtures_dir=FIXTURES_DIR):
+    """把响应缓存中的条目导出为测试夹具，每个响应一个文件"""
+    conn = sqlite3.connect(cache_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT key, url, body FROM responses")
+
+    exported = 0
+    for key, url, body in cursor:
+        source = next(
+            (name for name, endpoint in API_ENDPOINTS.items() if url.startswith(endpoint)),
+            'other'
+        )
+        path = Path(fixtures_dir) / source / f"{key}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'url': url, 'body': json.loads(body)}, f, ensure_ascii=False)
+        exported += 1
+
+    conn.close()
+    return exported
+
+def record(count=100, source="both", fixtures_dir=FIXTURES_DIR):
+    """用真实API获取一次（写入临时数据库），把所有响应录制为夹具"""
+    with tempfile.TemporaryDirectory() as tmp:
+        fetcher = ImageFetcher(use_cache=False)
+        fetcher.db_path = str(Path(tmp) / "images.db")
+        fetcher.cache = ResponseCache(Path(tmp) / "api_cache.db")
+        fetcher.fetch_images(count, source)
+        return export_cache(fetcher.cache.path, fixtures_dir)
+
+def synthetic_page(source, params):
+    """按查询参数确定性地生成一页搜索结果"""
+    query = params.get('query') or params.get('q', '')
+    page = int(params.get('page', 1))
+    per_page = int(params.get('per_page', PER_PAGE[source]))
+
+    rng = random.Random(f"{source}:{query}:{page}")
+    ids = []
+    for i in range(per_page):
+        if rng.random() < SYNTHETIC_SHARED_RATIO:
+            ids.append(f"shared{page}x{rng.randrange(per_page)}")
+        else:
+            ids.append(f"{query}{page}x{i}")
+
+    if source == 'unsplash':
+        return {
+            'total_pages': SYNTHETIC_PAGES,
+            'results': [{
+                'id': image_id,
+                'urls': {'thumb': f"https://images.unsplash.com/{image_id}?w=200",
+                         'regular': f"https://images.unsplash.com/{image_id}?w=1080"},
+                'width': 4000,
+                'height': 3000,
+                'likes': rng.randrange(1000),
+                'description': f"{query} photo",
+                'user': {'name': 'Benchmark', 'links': {'html': 'https://unsplash.com/@benchmark'}},
+            } for image_id in ids]
+        }
+
+    return {
+        'totalHits': SYNTHETIC_PAGES * per_page,
+        'hits': [{
+            'id': image_id,
+            'previewURL': f"https://cdn.pixabay.com/{image_id}_150.jpg",
+            'largeImageURL': f"https://pixabay.com/get/{image_id}_1280.jpg",
+            'imageWidth': 4000,
+            'imageHeight': 3000,
+            'likes': rng.randrange(1000),
+            'user': 'benchmark',
+            'user_id': 1,
+            'tags': f"{query}, benchmark",
+        } for image_id in ids]
+    }
+
+class StubAPIServer:
+    """本地桩服务器：按 /<来源>/<原路径> 回放录制的响应，可模拟延迟和429限流"""
+
+    def __init__(self, fixtures=None, latency=0.0, error_rate=0.0, retry_after=1,
+                 synthetic=True, port=0, seed=0):
+        self.fixtures = fixtures or {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.synthetic = synthetic
+        self.port = port
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'fixture_hits': 0, 'synthetic': 0, 'missing': 0}
+        self.server = None
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def respond(self, path, query):
+        """返回 (状态码, 响应头, 响应体)"""
+        self.count('requests')
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self.lock:
+            throttled = self.random.random() < self.error_rate
+        if throttled:
+            self.count('throttled')
+            return 429, {'Retry-After': str(self.retry_after)}, b'{"error": "rate limited"}'
+
+        source, _, rest = path.lstrip('/').partition('/')
+        if source not in API_ENDPOINTS:
+            return 404, {}, b'{"error": "unknown source"}'
+
+        upstream = urlsplit(API_ENDPOINTS[source])
+        url = f"{upstream.scheme}://{upstream.netloc}/{rest}"
+        params = dict(parse_qsl(query))
+
+        body = self.fixtures.get(ResponseCache.make_key(ResponseCache.normalize(url, params)))
+        if body is not None:
+            self.count('fixture_hits')
+        elif self.synthetic:
+            self.count('synthetic')
+            body = json.dumps(synthetic_page(source, params))
+        else:
+            self.count('missing')
+            return 404, {}, b'{"error": "no fixture"}'
+
+        return 200, {'Content-Type': 'application/json'}, body.encode('utf-8')
+
+    def start(self):
+        """在后台线程启动服务器，返回基础URL"""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                status, headers, body = stub.respond(parts.path, parts.query)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+def run_benchmark(count=1000, source="both", concurrent=False, max_workers=8, budget=None,
+                  chunk_size=100, rate=None, latency=0.0, error_rate=0.0, retry_after=1,
+                  fixtures_dir=FIXTURES_DIR, synthetic=True):
+    """对桩服务器运行一次完整获取，返回性能报告"""
+    fixtures = load_fixtures(fixtures_dir) if Path(fixtures_dir).exists() else {}
+    server = StubAPIServer(fixtures, latency, error_rate, retry_after, synthetic)
+    base_url = server.start()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            fetcher = ImageFetcher(use_cache=False)
+            fetcher.db_path = str(Path(tmp) / "images.db")
+            fetcher.unsplash_key = fetcher.unsplash_key or 'benchmark'
+            fetcher.pixabay_key = fetcher.pixabay_key or 'benchmark'
+            fetcher.endpoints = {
+                name: f"{base_url}/{name}{urlsplit(endpoint).path}"
+                for name, endpoint in API_ENDPOINTS.items()
+            }
+
+            # 默认不限流，只测量获取流程本身；--rate 模拟每秒请求上限
+            limit = rate or 1_000_000
+            fetcher.rate_limiters = {
+                name: TokenBucket(limit, 1, burst=1) for name in fetcher.rate_limiters
+            }
+
+            # 统计数据库写入耗时
+            insert_times = []
+            save_images = fetcher.save_images
+
+            def timed_save(images, cursor_rows=()):
+                started = time.perf_counter()
+                saved = save_images(images, cursor_rows)
+                insert_times.append(time.perf_counter() - started)
+                return saved
+
+            fetcher.save_images = timed_save
+
+            started = time.perf_counter()
+            saved_count = fetcher.fetch_images(count, source, concurrent, max_workers, budget, chunk_size)
+            elapsed = time.perf_counter() - started
+    finally:
+        server.stop()
+
+    api_calls = server.stats['requests']
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'count': count,
+            'source': source,
+            'concurrent': concurrent,
+            'workers': max_workers,
+            'budget': budget,
+            'chunk_size': chunk_size,
+            'rate': rate,
+            'latency': latency,
+            'error_rate': error_rate,
+            'fixtures': len(fixtures),
+        },
+        'images': saved_count,
+        'elapsed_seconds': round(elapsed, 3),
+        'images_per_second': round(saved_count / elapsed, 1) if elapsed else 0,
+        'api_calls': api_calls,
+        'throttled': server.stats['throttled'],
+        'api_calls_per_image': round(api_calls / saved_count, 3) if saved_count else None,
+        'db_insert_seconds': round(sum(insert_times), 4),
+        'db_chunks': len(insert_times),
+        'server': server.stats,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="图片获取基准测试")
+    subparsers = parser.add_subparsers(dest="command", help="可用命令")
+
+    record_parser = subparsers.add_parser("record", help="录制API响应为测试夹具")
+    record_parser.add_argument("--count", type=int, default=100, help="获取图片数量")
+    record_parser.add_argument("--source", choices=["unsplash", "pixabay", "both"], default="both")
+    record_parser.add_argument("--from-cache", help="从已有响应缓存导出，不请求真实API")
+    record_parser.add_argument("--fixtures", default=str(FIXTURES_DIR), help="夹具目录")
+
+    def add_server_args(sub):
+        sub.add_argument("--latency", type=float, default=0.0, help="每个请求的模拟延迟（秒）")
+        sub.add_argument("--error-rate", type=float, default=0.0, help="返回429的比例（0-1）")
+        sub.add_argument("--retry-after", type=int, default=1, help="429响应的Retry-After秒数")
+        sub.add_argument("--fixtures", default=str(FIXTURES_DIR), help="夹具目录")
+        sub.add_argument("--no-synthetic", action="store_true", help="夹具缺失时返回404而不是合成数据")
+
+    serve_parser = subparsers.add_parser("serve", help="只启动桩服务器")
+    serve_parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    add_server_args(serve_parser)
+
+    run_parser = subparsers.add_parser("run", help="对桩服务器运行获取基准测试")
+    run_parser.add_argument("--count", type=int, default=1000, help="获取图片数量")
+    run_parser.add_argument("--source", choices=["unsplash", "pixabay", "both"], default="both")
+    run_parser.add_argument("--concurrent", action="store_true", help="并发获取模式")
+    run_parser.add_argument("--workers", type=int, default=8, help="并发请求线程数")
+    run_parser.add_argument("--budget", type=int, help="每个来源最多请求次数")
+    run_parser.add_argument("--chunk-size", type=int, default=100, help="每多少张提交一次数据库")
+    run_parser.add_argument("--rate", type=int, help="每个来源每秒最多请求数（默认不限）")
+    add_server_args(run_parser)
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        if args.from_cache:
+            exported = export_cache(args.from_cache, args.fixtures)
+        else:
+            exported = record(args.count, args.source, args.fixtures)
+        print(f"✅ 已录制 {exported} 个响应到 {args.fixtures}")
+
+    elif args.command == "serve":
+        fixtures = load_fixtures(args.fixtures) if Path(args.fixtures).exists() else {}
+        server = StubAPIServer(fixtures, args.latency, args.error_rate, args.retry_after,
+                               not args.no_synthetic, args.port)
+        print(f"🚀 桩服务器已启动: {server.start()} （{len(fixtures)} 个夹具）")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
+
+    elif args.command == "run":
+        report = run_benchmark(
+            args.count, args.source, args.concurrent, args.workers, args.budget,
+            args.chunk_size, args.rate, args.latency, args.error_rate, args.retry_after,
+            args.fixtures, not args.no_synthetic
+        )
+
+        print("\n📊 获取基准测试结果:")
+        print(f"  新图片: {report['images']}")
+        print(f"  耗时: {report['elapsed_seconds']}s")
+        print(f"  吞吐量: {report['images_per_second']} 张/秒")
+        print(f"  API请求: {report['api_calls']} 次（429: {report['throttled']}）")
+        print(f"  每张新图片的API请求: {report['api_calls_per_image']}")
+        print(f"  数据库写入: {report['db_insert_seconds']}s / {report['db_chunks']} 次提交")
+
+        report_path = Path("logs") / f"fetch_bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        report_path.parent.mkdir(exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"📄 详细报告已保存到: {report_path}")
+
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
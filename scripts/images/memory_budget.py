@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+内存预算 - 按图片尺寸估计每个任务的峰值内存，总预留不超过上限时才放行新任务
+"""
+
+import os
+import threading
+
+# 每个像素在处理过程中的大致峰值内存：原图RGB、蒙版、RGBA抠图、合成中间图、
+# 透明通道统计的临时数组和编码缓冲区
+BYTES_PER_PIXEL = 20
+
+# 数据库中没有宽高时按1200万像素估计
+DEFAULT_SIZE = (4000, 3000)
+
+def estimate_job_bytes(width, height, max_edge=None):
+    """按原图宽高（和输出尺寸上限）估计一个任务的峰值内存"""
+    if not width or not height:
+        width, height = DEFAULT_SIZE
+
+    scale = min(1.0, max_edge / max(width, height)) if max_edge else 1.0
+    return int(width * scale * height * scale * BYTES_PER_PIXEL)
+
+def default_budget():
+    """默认预算：物理内存的一半，无法获取时返回None"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+class MemoryBudget:
+    """全局内存预算：多个线程按字节数预留，总量超过上限时阻塞
+
+    按到达顺序放行，大图不会被源源不断的小图饿死；单个任务超过上限时，
+    等到没有其他任务在处理时单独放行
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.reservations = {}
+        self.condition = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+
+    def acquire(self, key, size):
+        """为key预留size字节，阻塞到预算足够"""
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.condition.wait_for(
+                lambda: self.serving == ticket and (not self.reservations or self.used + size <= self.limit)
+            )
+            self.serving += 1
+            self.reservations[key] = size
+            self.used += size
+            self.peak = max(self.peak, self.used)
+            self.condition.notify_all()
+        return size
+
+    def release(self, key):
+        """释放key的预留，没有预留时什么都不做"""
+        with self.condition:
+            size = self.reservations.pop(key, 0)
+            if size:
+                self.used -= size
+                self.condition.notify_all()
+        return size
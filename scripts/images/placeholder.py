@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+占位图 - 从抠图的小缩略图计算内联的低清占位图（LQIP，data URI形式的微型WebP）和主体主色
+"""
+
+import io
+import base64
+
+import numpy as np
+from PIL import Image
+
+# 计算主色的缩略图最长边
+COLOR_EDGE = 64
+
+# 占位图的最长边和WebP质量，编码后一般只有一两百字节
+LQIP_EDGE = 16
+LQIP_QUALITY = 40
+
+def dominant_color(image):
+    """主体主色 #rrggbb：按不透明度加权的颜色直方图（每通道16级）中权重最大的一格的平均颜色，全透明时返回None"""
+    pixels = np.asarray(image.convert('RGBA'), dtype=np.uint32).reshape(-1, 4)
+    weights = pixels[:, 3]
+    if not weights.any():
+        return None
+
+    bins = (pixels[:, 0] >> 4) << 8 | (pixels[:, 1] >> 4) << 4 | (pixels[:, 2] >> 4)
+    totals = np.bincount(bins, weights=weights, minlength=4096)
+    selected = bins == totals.argmax()
+    color = np.average(pixels[selected, :3], axis=0, weights=weights[selected])
+    return '#' + ''.join(f"{int(round(channel)):02x}" for channel in color)
+
+def lqip_data_uri(image, edge=LQIP_EDGE, quality=LQIP_QUALITY):
+    """缩小到edge并编码为带透明通道的WebP，返回可直接内联的data URI"""
+    tiny = image.copy()
+    tiny.thumbnail((edge, edge), Image.BILINEAR)
+
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'WEBP', quality=quality, method=6)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def compute_placeholder(image):
+    """从抠图计算占位图和主色，先缩小到COLOR_EDGE，不在全尺寸上计算"""
+    scale = min(1.0, COLOR_EDGE / max(image.size))
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    small = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+    return {
+        'placeholder': lqip_data_uri(small),
+        'dominant_color': dominant_color(small),
+    }
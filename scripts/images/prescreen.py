@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+缩略图预筛选 - 下载原图和去背景之前，用缩略图快速估计是否适合抠图，并检测近似重复
+"""
+
+import io
+from itertools import combinations
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+# 预筛选缩略图统一缩放到的最长边
+THUMBNAIL_EDGE = 160
+
+# 低于该分数的图片直接拒绝
+DEFAULT_THRESHOLD = 0.35
+
+# 适合抠图的宽高比范围
+MIN_ASPECT_RATIO = 0.5
+MAX_ASPECT_RATIO = 2.0
+
+# 感知哈希汉明距离不超过该值视为近似重复（64位dHash）
+DUPLICATE_RADIUS = 6
+
+# 各项指标的权重
+WEIGHTS = {
+    'contrast': 0.4,
+    'border_uniformity': 0.3,
+    'edge_calm': 0.2,
+    'aspect': 0.1,
+}
+
+def load_thumbnail(data):
+    """从字节解码缩略图并缩小到统一尺寸"""
+    image = Image.open(io.BytesIO(data))
+    image.draft('RGB', (THUMBNAIL_EDGE, THUMBNAIL_EDGE))
+    image = image.convert('RGB')
+    image.thumbnail((THUMBNAIL_EDGE, THUMBNAIL_EDGE))
+    return image
+
+def border_mask(height, width, ratio=0.1):
+    """图片四周边框区域的布尔掩码"""
+    band_h = max(1, int(height * ratio))
+    band_w = max(1, int(width * ratio))
+    mask = np.zeros((height, width), dtype=bool)
+    mask[:band_h, :] = True
+    mask[-band_h:, :] = True
+    mask[:, :band_w] = True
+    mask[:, -band_w:] = True
+    return mask
+
+def center_mask(height, width, ratio=0.25):
+    """图片中心区域的布尔掩码"""
+    mask = np.zeros((height, width), dtype=bool)
+    top, left = int(height * ratio), int(width * ratio)
+    mask[top:height - top, left:width - left] = True
+    return mask
+
+def score_thumbnail(image, width=None, height=None):
+    """给缩略图打分（0-1），越高越适合抠图
+
+    - contrast: 中心主体与四周背景的颜色差异
+    - border_uniformity: 四周背景越单一越好
+    - edge_calm: 整体边缘越少（背景越不杂乱）越好
+    - aspect: 原图宽高比是否在合适范围内
+
+    返回 (分数, 各项指标)
+    """
+    pixels = np.asarray(image, dtype=np.float32) / 255.0
+    h, w = pixels.shape[:2]
+
+    border = pixels[border_mask(h, w)]
+    center = pixels[center_mask(h, w)]
+
+    # 中心与边框的平均颜色距离，RGB空间最大距离为sqrt(3)
+    contrast = float(np.linalg.norm(center.mean(axis=0) - border.mean(axis=0)) / np.sqrt(3))
+    contrast = min(1.0, contrast * 3)
+
+    # 边框颜色标准差越小背景越干净
+    border_uniformity = float(max(0.0, 1.0 - border.std(axis=0).mean() * 4))
+
+    # 边缘像素占比
+    edges = np.asarray(image.convert('L').filter(ImageFilter.FIND_EDGES), dtype=np.float32)
+    edge_density = float((edges > 48).mean())
+    edge_calm = max(0.0, 1.0 - edge_density * 4)
+
+    ratio = (width / height) if width and height else (w / h)
+    aspect = 1.0 if MIN_ASPECT_RATIO <= ratio <= MAX_ASPECT_RATIO else 0.0
+
+    metrics = {
+        'contrast': round(contrast, 3),
+        'border_uniformity': round(border_uniformity, 3),
+        'edge_calm': round(edge_calm, 3),
+        'aspect': aspect,
+    }
+    score = sum(WEIGHTS[name] * value for name, value in metrics.items())
+
+    return round(score, 3), metrics
+
+def dhash(image, hash_size=8):
+    """差值哈希（dHash）：比较相邻像素亮度，返回hash_size*hash_size位整数"""
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+def hamming(a, b):
+    """两个哈希的汉明距离"""
+    return bin(a ^ b).count('1')
+
+class MultiIndexHash:
+    """多索引哈希表，支持汉明半径内的近邻查询
+
+    把哈希切成若干段分别建索引。半径r内的两个哈希至少有一段的距离不超过 r // 段数（鸽巢原理），
+    所以只需在每段上枚举该距离内的变体做精确查找，再核对完整距离。
+    """
+
+    def __init__(self, bits=64, chunks=4):
+        self.chunk_bits = bits // chunks
+        self.chunk_mask = (1 << self.chunk_bits) - 1
+        self.tables = [{} for _ in range(chunks)]
+        self.size = 0
+
+    def split(self, value):
+        """把哈希切成各段的值"""
+        return [(value >> (i * self.chunk_bits)) & self.chunk_mask for i in range(len(self.tables))]
+
+    def variants(self, part, radius):
+        """枚举与part汉明距离不超过radius的所有段值"""
+        for distance in range(radius + 1):
+            for positions in combinations(range(self.chunk_bits), distance):
+                variant = part
+                for position in positions:
+                    variant ^= 1 << position
+                yield variant
+
+    def add(self, value, key):
+        """插入哈希值及其对应的图片ID"""
+        for table, part in zip(self.tables, self.split(value)):
+            table.setdefault(part, []).append((value, key))
+        self.size += 1
+
+    def find(self, value, radius):
+        """返回半径内最近的 (距离, 图片ID)，没有时返回None"""
+        sub_radius = radius // len(self.tables)
+        best = None
+        checked = set()
+
+        for table, part in zip(self.tables, self.split(value)):
+            for variant in self.variants(part, sub_radius):
+                for candidate, key in table.get(variant, ()):
+                    if key in checked:
+                        continue
+                    checked.add(key)
+
+                    distance = hamming(value, candidate)
+                    if distance <= radius and (best is None or distance < best[0]):
+                        best = (distance, key)
+
+        return best
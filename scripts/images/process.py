@@ -5,176 +5,907 @@
 
 import os
 import sys
+import time
+import uuid
+import socket
 import sqlite3
-import requests
+import json
 import argparse
 from pathlib import Path
-from PIL import Image
-import tempfile
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# 添加项目根目录到路径
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from scripts.utils.http_client import get_session
+from scripts.images.alpha_stats import (
+    CROP_PADDING, GATE_THRESHOLDS, check_cutout, compute_alpha_stats, crop_cutout
+)
+from scripts.images.cutout_cache import CUTOUT_CACHE_SIZE, CutoutCache
+from scripts.images.encoder import (
+    DEFAULT_PNG_LEVEL, DERIVATIVE_FORMAT, DERIVATIVE_WIDTHS, PNG_LEVELS, VARIANT_FORMATS,
+    check_formats, recompress_png, write_derivatives, write_variants
+)
+from scripts.images.memory_budget import MemoryBudget, default_budget, estimate_job_bytes
+from scripts.images.placeholder import compute_placeholder
+from scripts.images.prescreen import (
+    DEFAULT_THRESHOLD, DUPLICATE_RADIUS, MultiIndexHash,
+    dhash, hamming, load_thumbnail, score_thumbnail
+)
 
 try:
-    from rembg import remove, new_session
+    from scripts.images.segmentation import (
+        DEFAULT_MODEL, FLUSH_TIMEOUT, MODEL_INPUTS, WORK_EDGE, BatchSegmenter, create_session, init_worker, onnx_threads_per_worker,
+        prepare_model, remove_background, segment_to_file
+    )
+    from scripts.images.segment_bench import (
+        BENCH_MODELS, SAMPLES_DIR, bench_batch_sizes, bench_models, load_samples, save_report
+    )
 except ImportError:
     print("❌ 请安装rembg: pip install rembg")
     sys.exit(1)
 
+# 处理阶段在images表上使用的附加列
+PROCESS_COLUMNS = {
+    'processed_at': 'TEXT',
+    'processed_path': 'TEXT',
+    'rejected': 'BOOLEAN DEFAULT FALSE',
+    'reject_reason': 'TEXT',
+    'prescreen_score': 'REAL',
+    'phash': 'TEXT',
+    'transparent_ratio': 'REAL',
+    'foreground_ratio': 'REAL',
+    'bbox': 'TEXT',
+    'edge_softness': 'REAL',
+    'island_count': 'INTEGER',
+    'edge_alpha': 'REAL',
+    'aspect_ratio': 'TEXT',
+    'quality_score': 'REAL',
+    'file_size': 'INTEGER',
+    'cutout_width': 'INTEGER',
+    'cutout_height': 'INTEGER',
+    'crop_left': 'INTEGER',
+    'crop_top': 'INTEGER',
+    'canvas_width': 'INTEGER',
+    'canvas_height': 'INTEGER',
+    'placeholder': 'TEXT',
+    'dominant_color': 'TEXT',
+    'lease_owner': 'TEXT',
+    'lease_expires': 'REAL',
+}
+
+# 多个处理实例共用一个数据库时，等待写锁的秒数
+DB_TIMEOUT = 30
+
+# 认领图片的租约时长（秒），处理期间每 LEASE_SECONDS / 3 续约一次，过期未续约的图片可被其他实例重新认领
+LEASE_SECONDS = 300
+
+# 等待处理中的近似重复图片完成时，重新检查的间隔（秒）；其他实例处理的图片只能轮询
+DEDUP_POLL = 1.0
+
+# 单个下载文件的大小上限，超过时放弃
+MAX_DOWNLOAD_BYTES = 40 * 1024 * 1024
+
+# 下载缓冲区的初始大小（服务器未返回Content-Length时）
+READ_CHUNK_SIZE = 256 * 1024
+
+# 流水线阶段之间传递的结束标记
+STOP = object()
+
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, prescreen=True, prescreen_threshold=DEFAULT_THRESHOLD,
+                 dedup=True, duplicate_radius=DUPLICATE_RADIUS, processes=0,
+                 max_edge=None, work_edge=None, infer_batch=1, flush_timeout=FLUSH_TIMEOUT,
+                 model=DEFAULT_MODEL, quantize=False, cutout_cache=True,
+                 cutout_cache_size=CUTOUT_CACHE_SIZE, png_level=DEFAULT_PNG_LEVEL, formats=(),
+                 crop_padding=None, quality_gate=GATE_THRESHOLDS, worker_id=None,
+                 lease_seconds=LEASE_SECONDS, memory_budget=None, widths=DERIVATIVE_WIDTHS,
+                 derivative_format=DERIVATIVE_FORMAT):
         self.db_path = "images.db"
         self.output_dir = Path("processed_images")
         self.output_dir.mkdir(exist_ok=True)
+        self.session = get_session()
+        
+        # 缩略图预筛选，低分图片不下载原图
+        self.prescreen = prescreen
+        self.prescreen_threshold = prescreen_threshold
+        
+        # 缩略图感知哈希去重，索引在首次使用时从数据库加载，之后按处理时间增量补充
+        self.dedup = dedup
+        self.duplicate_radius = duplicate_radius
+        self.hash_index = None
+        self.indexed_ids = set()
+        self.hash_watermark = None
+        self.lock = threading.Lock()
+        # 图片处理结束时通知等待它的近似重复图片
+        self.dedup_changed = threading.Condition(self.lock)
+        
+        # 认领图片时使用的实例ID和租约时长
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        
+        # 每个下载线程复用一个缓冲区
+        self.buffers = threading.local()
+        
+        # 输出尺寸上限和推理分辨率上限，None时使用原图尺寸
+        self.max_edge = max_edge
+        self.work_edge = work_edge
+        
+        # 同时在处理中的图片的内存预算（字节），None时不限制
+        self.budget = MemoryBudget(memory_budget) if memory_budget else None
+        
+        # 原图和蒙版的内容寻址缓存，重新处理时跳过下载和推理
+        self.cutout_cache = CutoutCache(max_bytes=cutout_cache_size) if cutout_cache else None
+        self.cache_params = {'max_edge': max_edge, 'work_edge': work_edge, 'quantize': quantize}
+        
+        # 编码：PNG压缩级别和并行编码的附加格式（webp/avif）
+        self.png_level = png_level
+        self.formats = check_formats(formats)
+        self.encode_pool = None
+        
+        # srcset派生图的宽度阶梯和格式，宽度为空时不生成
+        self.widths = sorted(set(widths))
+        self.derivative_format = derivative_format
+        if derivative_format != 'png' and not check_formats([derivative_format]):
+            self.derivative_format = 'png'
+        
+        # 裁剪到主体时保留的边距，None时保持原画布
+        self.crop_padding = crop_padding
+        
+        # 透明通道统计的质量门槛，None时不检查
+        self.quality_gate = quality_gate
+        
+        # 进程池模式：每个工作进程各自加载模型，主进程不加载
+        self.processes = processes
+        self.process_pool = None
+        
+        self.init_database()
         
-        # 初始化rembg session
+        # 初始化rembg session，批量推理时由BatchSegmenter合并各线程的前向传播
+        self.model = model
+        self.quantize = quantize
+        self.rembg_session = None
+        self.segmenter = None
+        self.infer_batch = infer_batch
+        if not processes:
+            try:
+                self.rembg_session = create_session(model, dynamic_batch=infer_batch > 1,
+                                                    quantize=quantize)
+                self.segmenter = self.rembg_session
+                if infer_batch > 1:
+                    self.segmenter = BatchSegmenter(self.rembg_session, infer_batch, flush_timeout)
+            except Exception as e:
+                print(f"❌ 初始化rembg失败: {e}")
+    
+    def init_database(self):
+        """补充处理阶段需要的列
+        
+        在写事务中检查并补充列，多个实例同时启动时后到的实例等前一个迁移完成后再读表结构，
+        不会重复添加同一列
+        """
+        conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT, isolation_level=None)
+        cursor = conn.cursor()
+        
+        cursor.execute("BEGIN IMMEDIATE")
         try:
-            self.rembg_session = new_session('u2net')
-        except Exception as e:
-            print(f"❌ 初始化rembg失败: {e}")
-            self.rembg_session = None
+            cursor.execute("PRAGMA table_info(images)")
+            columns = {row[1] for row in cursor.fetchall()}
+            
+            # images表由fetch.py创建，不存在时跳过
+            if columns:
+                for name, definition in PROCESS_COLUMNS.items():
+                    if name not in columns:
+                        cursor.execute(f"ALTER TABLE images ADD COLUMN {name} {definition}")
+                
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_images_lease ON images (processed, lease_expires)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_images_processed_at ON images (processed_at)")
+            
+            # 每张抠图各编码格式的文件、大小和编码耗时
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS image_variants (
+                    image_id TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    encode_ms REAL,
+                    optimized BOOLEAN DEFAULT FALSE,
+                    created_at TEXT,
+                    PRIMARY KEY (image_id, format)
+                )
+            ''')
+            
+            # srcset派生图：每张抠图按宽度阶梯缩小的版本，url在上传到R2后填写
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS image_derivatives (
+                    image_id TEXT NOT NULL,
+                    width INTEGER NOT NULL,
+                    height INTEGER NOT NULL,
+                    format TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    encode_ms REAL,
+                    url TEXT,
+                    created_at TEXT,
+                    PRIMARY KEY (image_id, width, format)
+                )
+            ''')
+            
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
     
     def get_unprocessed_images(self, limit=None):
-        """获取未处理的图片"""
-        conn = sqlite3.connect(self.db_path)
+        """认领未处理、未被拒绝且没有有效租约的图片
+        
+        在一个写事务中选出图片并写入本实例的租约，多个实例同时认领时不会拿到同一张图片。
+        租约已过期的图片（认领它的实例崩溃或卡住）会被重新认领
+        """
+        conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT, isolation_level=None)
         cursor = conn.cursor()
         
-        query = "SELECT * FROM images WHERE processed = FALSE"
-        if limit:
-            query += f" LIMIT {limit}"
+        now = time.time()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            query = """
+                SELECT id, lease_owner FROM images
+                WHERE processed = FALSE AND (rejected IS NULL OR rejected = FALSE)
+                  AND (lease_expires IS NULL OR lease_expires < ?)
+            """
+            if limit:
+                query += f" LIMIT {limit}"
+            
+            claimed = cursor.execute(query, (now,)).fetchall()
+            # 清除上次尝试登记的感知哈希，重新预筛选之前不算作处理中的图片
+            cursor.executemany(
+                "UPDATE images SET lease_owner = ?, lease_expires = ?, phash = NULL WHERE id = ?",
+                [(self.worker_id, now + self.lease_seconds, image_id) for image_id, _ in claimed]
+            )
+            
+            cursor.execute("SELECT * FROM images WHERE lease_owner = ? AND processed = FALSE",
+                           (self.worker_id,))
+            images = cursor.fetchall()
+            
+            # 获取列名
+            columns = [description[0] for description in cursor.description]
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
         
-        cursor.execute(query)
-        images = cursor.fetchall()
+        reclaimed = sum(1 for _, owner in claimed if owner and owner != self.worker_id)
+        if reclaimed:
+            print(f"♻️ 重新认领 {reclaimed} 张租约过期的图片")
+        
+        # 转换为字典列表
+        return [dict(zip(columns, row)) for row in images]
+    
+    def renew_leases(self):
+        """续约本实例认领且尚未完成的图片，返回续约数量"""
+        conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT)
+        cursor = conn.cursor()
         
-        # 获取列名
-        columns = [description[0] for description in cursor.description]
+        cursor.execute("""
+            UPDATE images SET lease_expires = ?
+            WHERE lease_owner = ? AND processed = FALSE
+        """, (time.time() + self.lease_seconds, self.worker_id))
         
+        renewed = cursor.rowcount
+        conn.commit()
         conn.close()
+        return renewed
+    
+    def release_leases(self, image_id=None):
+        """释放本实例剩余的租约（处理失败的图片），下次运行时可被任何实例认领；指定image_id时只释放这一张"""
+        conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT)
+        cursor = conn.cursor()
         
-        # 转换为字典列表
-        return [dict(zip(columns, row)) for row in images]
+        query = "UPDATE images SET lease_owner = NULL, lease_expires = NULL WHERE lease_owner = ?"
+        params = (self.worker_id,)
+        if image_id is not None:
+            query += " AND id = ?"
+            params += (image_id,)
+        cursor.execute(query, params)
+        
+        released = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return released
+    
+    def heartbeat(self, stop_event):
+        """心跳线程：处理期间定期续约"""
+        while not stop_event.wait(self.lease_seconds / 3):
+            try:
+                self.renew_leases()
+            except sqlite3.Error as e:
+                print(f"⚠️ 租约续约失败: {e}")
     
-    def download_image(self, url, timeout=30):
-        """下载图片"""
+    def read_buffer(self, size):
+        """当前线程复用的下载缓冲区，至少size字节"""
+        buffer = getattr(self.buffers, 'data', None)
+        if buffer is None:
+            buffer = self.buffers.data = bytearray(size)
+        elif len(buffer) < size:
+            buffer.extend(bytes(size - len(buffer)))
+        return buffer
+    
+    def download_image(self, url, timeout=30, max_bytes=MAX_DOWNLOAD_BYTES):
+        """流式下载图片到线程复用的缓冲区，超过max_bytes时放弃
+        
+        直接readinto到缓冲区，不经过分块列表拼接和临时文件，返回一份大小刚好的bytes
+        """
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=timeout, stream=True)
-            response.raise_for_status()
-            
-            return response.content
+            with self.session.get(url, timeout=timeout, stream=True) as response:
+                response.raise_for_status()
+                
+                declared = int(response.headers.get('Content-Length') or 0)
+                if declared > max_bytes:
+                    raise ValueError(f"文件过大: {declared} 字节")
+                
+                # 多留1字节，读到第max_bytes+1字节说明超过上限
+                buffer = self.read_buffer(min(max(declared, READ_CHUNK_SIZE), max_bytes) + 1)
+                response.raw.decode_content = True
+                size = 0
+                
+                while True:
+                    if size == len(buffer):
+                        buffer = self.read_buffer(min(size * 2, max_bytes + 1))
+                    
+                    with memoryview(buffer) as view:
+                        read = response.raw.readinto(view[size:max_bytes + 1])
+                    if not read:
+                        break
+                    
+                    size += read
+                    if size > max_bytes:
+                        raise ValueError(f"文件超过 {max_bytes} 字节")
+                
+                with memoryview(buffer) as view:
+                    return view[:size].tobytes()
         except Exception as e:
             print(f"❌ 下载失败 {url}: {e}")
             return None
     
-    def remove_background(self, image_data):
-        """去除图片背景"""
-        if not self.rembg_session:
-            print("❌ rembg未初始化")
-            return None
+    def load_hash_index(self, cursor):
+        """把已处理图片的感知哈希加入多索引哈希表：首次全部加载，之后只读上次加载以来处理完成的图片
         
-        try:
-            # 使用临时文件处理
-            with tempfile.NamedTemporaryFile(suffix='.jpg') as temp_input:
-                temp_input.write(image_data)
-                temp_input.flush()
-                
-                # 打开图片
-                input_image = Image.open(temp_input.name)
+        只和已处理完成的图片比较：尚未处理或处理失败的图片不能作为拒绝其他图片的依据。
+        其他实例处理完成的图片也通过增量加载进入索引
+        """
+        if self.hash_index is None:
+            self.hash_index = MultiIndexHash()
+        
+        query = "SELECT id, phash, processed_at FROM images WHERE phash IS NOT NULL AND processed = TRUE"
+        params = ()
+        if self.hash_watermark:
+            # processed_at在提交前取值，等待写锁期间其他图片可能先提交，往前多读一段
+            query += " AND processed_at >= ?"
+            params = ((datetime.fromisoformat(self.hash_watermark) - timedelta(seconds=2 * DB_TIMEOUT)).isoformat(),)
+        
+        for image_id, phash, processed_at in cursor.execute(query, params).fetchall():
+            if image_id not in self.indexed_ids:
+                self.indexed_ids.add(image_id)
+                self.hash_index.add(int(phash, 16), image_id)
+            if processed_at and (self.hash_watermark is None or processed_at > self.hash_watermark):
+                self.hash_watermark = processed_at
+        
+        return self.hash_index.size
+    
+    def find_in_flight(self, cursor, image_id, phash):
+        """查找处理中的近似重复图片（本实例或其他实例已登记感知哈希、租约有效、尚未完成），返回其ID"""
+        cursor.execute("""
+            SELECT id, phash FROM images
+            WHERE processed = FALSE AND (rejected IS NULL OR rejected = FALSE)
+              AND lease_owner IS NOT NULL AND lease_expires >= ?
+              AND phash IS NOT NULL AND id != ?
+        """, (time.time(), image_id))
+        
+        best = None
+        for other_id, other_hash in cursor.fetchall():
+            distance = hamming(phash, int(other_hash, 16))
+            if distance <= self.duplicate_radius and (best is None or distance < best[0]):
+                best = (distance, other_id)
+        return best[1] if best else None
+    
+    def find_duplicate(self, image_id, phash):
+        """查找近似重复的已处理图片，返回其ID；没有重复时把本图片登记为处理中并返回None
+        
+        与处理中的图片近似重复时等待它结束：它处理成功则本图片作为重复被拒绝，失败或被拒绝则继续处理。
+        检查和登记在同一个写事务中，多个实例同时处理同一组近似重复图片时只有先登记的一张会被处理
+        """
+        waiting_for = None
+        
+        with self.lock:
+            while True:
+                conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT, isolation_level=None)
+                cursor = conn.cursor()
                 
-                # 去除背景
-                output_image = remove(input_image, session=self.rembg_session)
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    self.load_hash_index(cursor)
+                    match = self.hash_index.find(phash, self.duplicate_radius)
+                    duplicate_of = match[1] if match and match[1] != image_id else None
+                    
+                    pending = None
+                    if not duplicate_of:
+                        pending = self.find_in_flight(cursor, image_id, phash)
+                        if not pending:
+                            cursor.execute("UPDATE images SET phash = ? WHERE id = ? AND lease_owner = ?",
+                                           (format(phash, '016x'), image_id, self.worker_id))
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+                finally:
+                    conn.close()
                 
-                return output_image
+                if not pending:
+                    return duplicate_of
                 
+                if pending != waiting_for:
+                    print(f"⏸️ 等待处理中的近似重复图片: {image_id} -> {pending}")
+                    waiting_for = pending
+                self.dedup_changed.wait(DEDUP_POLL)
+    
+    def finish_in_flight(self, image_id, phash=None):
+        """图片处理结束（完成、拒绝或失败）后唤醒等待它的近似重复图片；处理完成时把感知哈希加入索引"""
+        if not self.dedup:
+            return
+        
+        with self.lock:
+            # 索引尚未加载时，首次查重会从数据库读到这张图片
+            if phash is not None and self.hash_index is not None and image_id not in self.indexed_ids:
+                self.indexed_ids.add(image_id)
+                self.hash_index.add(phash, image_id)
+            self.dedup_changed.notify_all()
+    
+    def prescreen_image(self, image_data):
+        """下载缩略图，打分并检测近似重复
+        
+        返回 (拒绝原因, 分数, 感知哈希)，通过时拒绝原因为None。
+        没有缩略图或下载失败时放行，交给完整处理流程判断
+        """
+        url = image_data.get('url_thumbnail')
+        if not url:
+            return None, None, None
+        
+        thumbnail_data = self.download_image(url, timeout=10)
+        if not thumbnail_data:
+            return None, None, None
+        
+        try:
+            thumbnail = load_thumbnail(thumbnail_data)
+            score, _ = score_thumbnail(thumbnail, image_data.get('width'), image_data.get('height'))
+            phash = dhash(thumbnail)
         except Exception as e:
-            print(f"❌ 背景去除失败: {e}")
+            print(f"❌ 预筛选失败 {image_data['id']}: {e}")
+            return None, None, None
+        
+        if self.prescreen and score < self.prescreen_threshold:
+            return f"预筛选分数过低: {score}", score, phash
+        
+        if self.dedup:
+            duplicate_of = self.find_duplicate(image_data['id'], phash)
+            if duplicate_of:
+                return f"近似重复: {duplicate_of}", score, phash
+        
+        return None, score, phash
+    
+    def remove_background(self, image_data, cache_key=None):
+        """去除图片背景"""
+        if not self.segmenter:
+            print("❌ rembg未初始化")
             return None
+        
+        return remove_background(image_data, self.segmenter, self.max_edge, self.work_edge,
+                                 self.cutout_cache, cache_key)
     
-    def process_single_image(self, image_data):
-        """处理单张图片"""
-        image_id = image_data['id']
-        url = image_data['url_regular']
+    def fetch_source(self, url):
+        """取原图：先查抠图缓存，未命中时下载并写入缓存
         
-        print(f"🔄 处理图片: {image_id}")
+        返回 (原图字节, 蒙版缓存键)，下载失败时原图为None
+        """
+        if not self.cutout_cache:
+            return self.download_image(url), None
         
-        try:
-            # 下载图片
+        raw_data, digest = self.cutout_cache.get_source(url)
+        if raw_data is None:
             raw_data = self.download_image(url)
             if not raw_data:
-                return False, "下载失败"
-            
-            # 去除背景
-            processed_image = self.remove_background(raw_data)
-            if not processed_image:
-                return False, "背景去除失败"
-            
-            # 保存处理后的图片
-            output_path = self.output_dir / f"{image_id}.png"
-            processed_image.save(output_path, 'PNG', optimize=True)
-            
-            # 更新数据库状态
-            self.mark_as_processed(image_id, str(output_path))
-            
-            print(f"✅ 处理完成: {image_id}")
-            return True, "成功"
-            
-        except Exception as e:
-            error_msg = f"处理异常: {e}"
-            print(f"❌ {image_id}: {error_msg}")
-            return False, error_msg
+                return None, None
+            digest = self.cutout_cache.put_source(url, raw_data)
+        
+        return raw_data, CutoutCache.mask_key(digest, self.model, self.cache_params)
+    
+    def download_stage(self, image_data):
+        """下载阶段：缩略图预筛选、近似重复检测和下载原图"""
+        image_id = image_data['id']
+        print(f"🔄 处理图片: {image_id}")
+        
+        score = phash = None
+        if self.prescreen or self.dedup:
+            reason, score, phash = self.prescreen_image(image_data)
+            if reason:
+                print(f"🚫 拒绝: {image_id} ({reason})")
+                return ('rejected', image_id, reason, score, phash)
+        
+        # 按数据库中的原图宽高预留内存，预算不足时等待其他图片处理完成
+        if self.budget:
+            self.budget.acquire(image_id, estimate_job_bytes(image_data.get('width'), image_data.get('height'),
+                                                             self.max_edge))
+        
+        raw_data, cache_key = self.fetch_source(image_data['url_regular'])
+        if not raw_data:
+            return ('failed', image_id, "下载失败")
+        
+        return {
+            'id': image_id,
+            'raw': raw_data,
+            'cache_key': cache_key,
+            'score': score,
+            'phash': phash,
+            'output_path': str(self.output_dir / f"{image_id}.png"),
+        }
     
-    def mark_as_processed(self, image_id, output_path):
-        """标记图片为已处理"""
-        conn = sqlite3.connect(self.db_path)
+    def segment_stage(self, job):
+        """推理阶段：去除背景，进程池模式下由工作进程直接编码保存"""
+        if self.process_pool:
+            future = self.process_pool.submit(segment_to_file, job['raw'], job['output_path'], job['cache_key'])
+            result = future.result()
+            if not result:
+                return ('failed', job['id'], "背景去除失败")
+            if 'rejected' in result:
+                return ('rejected', job['id'], result['rejected'], job['score'], job['phash'])
+            return ('processed', job['id'], job['output_path'], job['score'], job['phash'],
+                    result['variants'], result['alpha_stats'], result['derivatives'])
+        
+        job['cutout'] = self.remove_background(job.pop('raw'), job['cache_key'])
+        if not job['cutout']:
+            return ('failed', job['id'], "背景去除失败")
+        return job
+    
+    def encode_stage(self, job):
+        """编码阶段：统计透明通道，拒绝未通过质量门槛的抠图，按需裁剪到主体，计算占位图，保存透明PNG、各附加格式和srcset派生图"""
+        cutout = job.pop('cutout')
+        alpha_stats = compute_alpha_stats(cutout.getchannel('A'))
+        
+        reason = check_cutout(alpha_stats, self.quality_gate) if self.quality_gate else None
+        if reason:
+            return ('rejected', job['id'], reason, job['score'], job['phash'])
+        
+        cutout, geometry = crop_cutout(cutout, alpha_stats['bbox'], self.crop_padding)
+        alpha_stats.update(geometry)
+        alpha_stats.update(compute_placeholder(cutout))
+        variants = write_variants(cutout, job['output_path'], self.formats,
+                                  self.png_level, self.encode_pool)
+        derivatives = write_derivatives(cutout, job['output_path'], self.widths, self.derivative_format,
+                                        self.png_level, self.encode_pool) if self.widths else []
+        return ('processed', job['id'], job['output_path'], job['score'], job['phash'],
+                variants, alpha_stats, derivatives)
+    
+    def mark_as_processed(self, image_id, output_path, prescreen_score=None, phash=None, variants=(),
+                          alpha_stats=None, derivatives=()):
+        """标记图片为已处理，同一事务中记录透明通道统计、裁剪几何信息、占位图、各编码格式和srcset派生图
+        
+        只在本实例仍持有租约时写入；租约已过期并被其他实例重新认领时放弃写入并返回False
+        """
+        conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT)
         cursor = conn.cursor()
         
+        stats = alpha_stats or {}
+        png_size = next((variant['bytes'] for variant in variants if variant['format'] == 'png'), None)
+        
         cursor.execute("""
             UPDATE images 
             SET processed = TRUE, 
                 processed_at = ?,
-                processed_path = ?
-            WHERE id = ?
-        """, (datetime.now().isoformat(), output_path, image_id))
+                processed_path = ?,
+                prescreen_score = COALESCE(?, prescreen_score),
+                phash = COALESCE(?, phash),
+                transparent_ratio = ?,
+                foreground_ratio = ?,
+                bbox = ?,
+                edge_softness = ?,
+                island_count = ?,
+                edge_alpha = ?,
+                aspect_ratio = ?,
+                quality_score = ?,
+                file_size = ?,
+                cutout_width = ?,
+                cutout_height = ?,
+                crop_left = ?,
+                crop_top = ?,
+                canvas_width = ?,
+                canvas_height = ?,
+                placeholder = ?,
+                dominant_color = ?,
+                lease_owner = NULL,
+                lease_expires = NULL
+            WHERE id = ? AND lease_owner = ?
+        """, (datetime.now().isoformat(), output_path, prescreen_score,
+              format(phash, '016x') if phash is not None else None,
+              stats.get('transparent_ratio'), stats.get('foreground_ratio'),
+              json.dumps(stats['bbox']) if stats.get('bbox') else None,
+              stats.get('edge_softness'), stats.get('island_count'), stats.get('edge_alpha'),
+              stats.get('aspect_ratio'),
+              stats.get('quality_score'), png_size,
+              stats.get('cutout_width'), stats.get('cutout_height'), stats.get('crop_left'),
+              stats.get('crop_top'), stats.get('canvas_width'), stats.get('canvas_height'),
+              stats.get('placeholder'), stats.get('dominant_color'), image_id, self.worker_id))
+        
+        if cursor.rowcount == 0:
+            conn.rollback()
+            conn.close()
+            print(f"⚠️ 租约已失效，放弃写入处理结果: {image_id}")
+            return False
+        
+        cursor.executemany("""
+            INSERT OR REPLACE INTO image_variants
+            (image_id, format, path, bytes, encode_ms, optimized, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(image_id, variant['format'], variant['path'], variant['bytes'], variant['encode_ms'],
+               variant['optimized'], datetime.now().isoformat()) for variant in variants])
+        
+        # 重新处理时宽度阶梯可能变化，先清掉旧记录
+        cursor.execute("DELETE FROM image_derivatives WHERE image_id = ?", (image_id,))
+        cursor.executemany("""
+            INSERT INTO image_derivatives
+            (image_id, width, height, format, path, bytes, encode_ms, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(image_id, derivative['width'], derivative['height'], derivative['format'], derivative['path'],
+               derivative['bytes'], derivative['encode_ms'], datetime.now().isoformat())
+              for derivative in derivatives])
+        
+        conn.commit()
+        conn.close()
+        return True
+    
+    def mark_as_rejected(self, image_id, reason, prescreen_score=None, phash=None):
+        """标记图片为已拒绝，不再进入处理和上传流程；和mark_as_processed一样只在仍持有租约时写入"""
+        conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT)
+        cursor = conn.cursor()
         
+        cursor.execute("""
+            UPDATE images 
+            SET rejected = TRUE,
+                reject_reason = ?,
+                prescreen_score = COALESCE(?, prescreen_score),
+                phash = COALESCE(?, phash),
+                lease_owner = NULL,
+                lease_expires = NULL
+            WHERE id = ? AND lease_owner = ?
+        """, (reason, prescreen_score,
+              format(phash, '016x') if phash is not None else None, image_id, self.worker_id))
+        
+        updated = cursor.rowcount
         conn.commit()
         conn.close()
+        
+        if not updated:
+            print(f"⚠️ 租约已失效，放弃写入拒绝结果: {image_id}")
+        return bool(updated)
+    
+    def run_stage(self, handler, inbox, outbox, records, workers):
+        """启动一个流水线阶段的工作线程
+        
+        每个线程从inbox取任务交给handler：返回任务字典时放入outbox交给下一阶段，
+        返回元组时作为结果记录交给数据库写入线程，并释放该图片的内存预留。收到结束标记的线程把标记放回inbox
+        通知同阶段其他线程，最后一个退出的线程再向outbox发送结束标记
+        """
+        remaining = [workers]
+        lock = threading.Lock()
+        
+        def work():
+            while True:
+                job = inbox.get()
+                if job is STOP:
+                    inbox.put(STOP)
+                    break
+                
+                try:
+                    result = handler(job)
+                except Exception as e:
+                    result = ('failed', job['id'], f"处理异常: {e}")
+                
+                if isinstance(result, tuple):
+                    if self.budget:
+                        self.budget.release(result[1])
+                    records.put(result)
+                else:
+                    outbox.put(result)
+            
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                outbox.put(STOP)
+        
+        for _ in range(workers):
+            threading.Thread(target=work, daemon=True).start()
+    
+    def write_records(self, records):
+        """数据库写入线程：唯一写库的线程，按到达顺序写入各阶段的结果"""
+        success_count = 0
+        encode_totals = {}
+        
+        while True:
+            record = records.get()
+            if record is STOP:
+                break
+            
+            status, image_id = record[:2]
+            try:
+                if status == 'processed':
+                    if not self.mark_as_processed(image_id, *record[2:]):
+                        self.finish_in_flight(image_id)
+                        continue
+                    self.finish_in_flight(image_id, record[4])
+                    success_count += 1
+                    print(f"✅ 处理完成: {image_id}")
+                    
+                    for variant in record[5] + record[7]:
+                        name = f"{variant['format']} {variant['width']}w" if 'width' in variant else variant['format']
+                        totals = encode_totals.setdefault(name, [0, 0, 0.0])
+                        totals[0] += 1
+                        totals[1] += variant['bytes']
+                        totals[2] += variant['encode_ms']
+                elif status == 'rejected':
+                    self.mark_as_rejected(image_id, *record[2:])
+                    self.finish_in_flight(image_id)
+                else:
+                    print(f"❌ {image_id}: {record[2]}")
+                    # 立即释放租约，等待它的近似重复图片不必等到批处理结束
+                    self.release_leases(image_id)
+                    self.finish_in_flight(image_id)
+            except Exception as e:
+                print(f"❌ 写入数据库失败 {image_id}: {e}")
+                self.finish_in_flight(image_id)
+        
+        for fmt, (count, size, elapsed) in encode_totals.items():
+            print(f"📦 {fmt}: {count} 张，平均 {size / count / 1024:.0f} KB，编码 {elapsed / count:.0f} ms/张")
+        
+        return success_count
     
-    def process_images_batch(self, batch_size=50, max_workers=4):
-        """批量处理图片"""
+    def process_images_batch(self, batch_size=50, download_workers=8, segment_workers=2,
+                             encode_workers=2, queue_size=8):
+        """批量处理图片
+        
+        下载、去背景、编码分成三个阶段，各自使用独立的线程池，阶段之间用有界队列连接：
+        下游处理不过来时上游阻塞，内存中最多有queue_size张原图和queue_size张抠图。
+        结果由当前线程统一写入数据库。图片按租约认领，处理期间由心跳线程续约，
+        结束时释放未完成图片的租约
+        """
         images = self.get_unprocessed_images(batch_size)
         
         if not images:
             print("📋 没有需要处理的图片")
             return 0
         
-        print(f"🚀 开始处理 {len(images)} 张图片...")
+        print(f"🚀 开始处理 {len(images)} 张图片（实例 {self.worker_id}，租约 {self.lease_seconds} 秒）...")
         
-        success_count = 0
+        if self.processes:
+            # 每个进程一个模型会话，ONNX算子内线程按核数平均分配
+            threads = onnx_threads_per_worker(self.processes)
+            if self.quantize:
+                prepare_model(self.model, quantize=True)
+            print(f"🧵 进程池模式: {self.processes} 个进程，每进程 {threads} 个ONNX线程")
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                # 工作进程由推理线程按需创建，fork会继承ONNX/OpenMP线程状态，改用spawn
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(self.model, threads, self.max_edge, self.work_edge, self.quantize,
+                          self.cutout_cache, {'formats': self.formats, 'png_level': self.png_level},
+                          self.crop_padding, self.quality_gate,
+                          {'widths': self.widths, 'fmt': self.derivative_format, 'png_level': self.png_level})
+            )
+            # 每个推理线程占用一个工作进程，编码也在工作进程中完成
+            segment_workers = self.processes
+        else:
+            # 同时提交的图片数不少于batch大小，batch才能凑满
+            segment_workers = max(segment_workers, self.infer_batch)
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交任务
-            future_to_image = {
-                executor.submit(self.process_single_image, image): image 
-                for image in images
-            }
-            
-            # 处理结果
-            for future in as_completed(future_to_image):
-                image = future_to_image[future]
-                try:
-                    success, message = future.result()
-                    if success:
-                        success_count += 1
-                except Exception as e:
-                    print(f"❌ 处理异常 {image['id']}: {e}")
+        print(f"⚙️ 流水线: 下载 {download_workers} / 去背景 {segment_workers} / "
+              f"编码 {encode_workers} 线程，队列上限 {queue_size}")
+        if self.budget:
+            print(f"🧮 内存预算: {self.budget.limit / 1024 / 1024:.0f} MB")
+        
+        downloads = queue.Queue()
+        for image in images:
+            downloads.put(image)
+        downloads.put(STOP)
+        
+        to_segment = queue.Queue(maxsize=queue_size)
+        to_encode = queue.Queue(maxsize=queue_size)
+        records = queue.Queue()
+        
+        if (self.formats or self.widths) and not self.processes:
+            # 各编码线程共享的格式和派生图编码线程池
+            parallel = max(len(self.formats) + 1, len(self.widths))
+            self.encode_pool = ThreadPoolExecutor(max_workers=encode_workers * parallel)
+        
+        stop_heartbeat = threading.Event()
+        threading.Thread(target=self.heartbeat, args=(stop_heartbeat,), daemon=True).start()
+        
+        try:
+            self.run_stage(self.download_stage, downloads, to_segment, records, download_workers)
+            self.run_stage(self.segment_stage, to_segment, to_encode, records, segment_workers)
+            self.run_stage(self.encode_stage, to_encode, records, records, encode_workers)
+            success_count = self.write_records(records)
+        finally:
+            stop_heartbeat.set()
+            self.release_leases()
+            if self.process_pool:
+                self.process_pool.shutdown()
+                self.process_pool = None
+            if self.encode_pool:
+                self.encode_pool.shutdown()
+                self.encode_pool = None
         
         print(f"✅ 批量处理完成: {success_count}/{len(images)} 成功")
+        if self.budget:
+            print(f"🧮 内存预留峰值: {self.budget.peak / 1024 / 1024:.0f} MB")
         return success_count
     
+    def recompress_pngs(self, limit=None):
+        """后台重新压缩：把快速模式保存的PNG用最高压缩重新编码，只在变小时替换
+        
+        以较低的优先级运行，不和处理流水线抢CPU
+        """
+        try:
+            os.nice(10)
+        except (AttributeError, OSError):
+            pass
+        
+        conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT)
+        cursor = conn.cursor()
+        query = "SELECT image_id, path, bytes FROM image_variants WHERE format = 'png' AND optimized = FALSE"
+        if limit:
+            query += f" LIMIT {limit}"
+        cursor.execute(query)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        if not rows:
+            print("📋 没有需要重新压缩的PNG")
+            return 0
+        
+        print(f"🗜️ 重新压缩 {len(rows)} 张PNG...")
+        saved_bytes = 0
+        
+        for image_id, path, size in rows:
+            try:
+                new_size, elapsed = recompress_png(path, size)
+            except Exception as e:
+                print(f"❌ 重新压缩失败 {image_id}: {e}")
+                continue
+            
+            saved_bytes += size - new_size
+            # images.file_size记录的是PNG大小，和image_variants在同一事务中更新
+            conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT)
+            conn.execute("""
+                UPDATE image_variants SET bytes = ?, optimized = TRUE
+                WHERE image_id = ? AND format = 'png'
+            """, (new_size, image_id))
+            conn.execute("UPDATE images SET file_size = ? WHERE id = ?", (new_size, image_id))
+            conn.commit()
+            conn.close()
+            print(f"✅ {image_id}: {size // 1024} KB -> {new_size // 1024} KB（{elapsed:.0f} ms）")
+        
+        print(f"✅ 重新压缩完成，共节省 {saved_bytes / (1024 * 1024):.1f} MB")
+        return len(rows)
+    
     def get_processing_stats(self):
         """获取处理统计信息"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT)
         cursor = conn.cursor()
         
         cursor.execute("SELECT COUNT(*) FROM images")
@@ -186,24 +917,129 @@ class ImageProcessor:
         cursor.execute("SELECT COUNT(*) FROM images WHERE uploaded = TRUE")
         uploaded = cursor.fetchone()[0]
         
+        cursor.execute("SELECT COUNT(*) FROM images WHERE rejected = TRUE")
+        rejected = cursor.fetchone()[0]
+        
+        cursor.execute("""
+            SELECT COUNT(*) FROM images
+            WHERE processed = FALSE AND lease_expires >= ?
+        """, (time.time(),))
+        leased = cursor.fetchone()[0]
+        
         conn.close()
         
         return {
             'total': total,
             'processed': processed,
             'uploaded': uploaded,
-            'pending': total - processed
+            'rejected': rejected,
+            'leased': leased,
+            'pending': total - processed - rejected
         }
 
 def main():
     parser = argparse.ArgumentParser(description="处理图片（去背景）")
     parser.add_argument("--batch-size", type=int, default=50, help="批处理大小")
-    parser.add_argument("--workers", type=int, default=4, help="并发工作线程数")
+    parser.add_argument("--workers", type=int, default=8, help="下载线程数")
+    parser.add_argument("--segment-workers", type=int, default=2, help="去背景线程数（进程池模式下等于进程数）")
+    parser.add_argument("--encode-workers", type=int, default=2, help="PNG编码线程数")
+    parser.add_argument("--queue-size", type=int, default=8, help="阶段之间队列的最大长度")
+    parser.add_argument("--processes", type=int, default=0,
+                       help="去背景工作进程数，每个进程独立加载模型（0为线程模式）")
+    parser.add_argument("--model", choices=sorted(MODEL_INPUTS), default=DEFAULT_MODEL, help="分割模型")
+    parser.add_argument("--quantize", action="store_true", help="使用本地生成的int8量化模型")
+    parser.add_argument("--no-cutout-cache", action="store_true", help="不使用原图和蒙版缓存")
+    parser.add_argument("--cutout-cache-size", type=int, default=CUTOUT_CACHE_SIZE // (1024 * 1024),
+                       help="原图和蒙版缓存的大小上限（MB）")
+    parser.add_argument("--png-level", choices=list(PNG_LEVELS), default=DEFAULT_PNG_LEVEL,
+                       help="PNG压缩级别（max为穷举压缩，较慢）")
+    parser.add_argument("--formats", default="",
+                       help=f"同时编码的附加格式，逗号分隔：{','.join(VARIANT_FORMATS)}")
+    parser.add_argument("--widths", default=",".join(map(str, DERIVATIVE_WIDTHS)),
+                       help="srcset派生图的宽度阶梯，逗号分隔，空字符串不生成")
+    parser.add_argument("--derivative-format", choices=['png'] + list(VARIANT_FORMATS), default=DERIVATIVE_FORMAT,
+                       help="srcset派生图的格式")
+    parser.add_argument("--recompress", action="store_true",
+                       help="后台重新压缩：用最高压缩重新编码快速模式保存的PNG")
+    parser.add_argument("--no-quality-gate", action="store_true", help="不按透明通道统计拒绝抠图")
+    parser.add_argument("--min-foreground", type=float, default=GATE_THRESHOLDS['min_foreground'],
+                        help="主体像素占比下限")
+    parser.add_argument("--max-foreground", type=float, default=GATE_THRESHOLDS['max_foreground'],
+                        help="主体像素占比上限（超过视为背景未去除）")
+    parser.add_argument("--max-islands", type=int, default=GATE_THRESHOLDS['max_islands'],
+                        help="主体不连通块数上限")
+    parser.add_argument("--max-edge-alpha", type=float, default=GATE_THRESHOLDS['max_edge_alpha'],
+                        help="画布边缘平均不透明度上限（0-1）")
+    parser.add_argument("--crop", action="store_true", help="裁掉主体四周的透明区域")
+    parser.add_argument("--crop-padding", type=int, default=CROP_PADDING, help="裁剪时保留的边距（像素）")
+    parser.add_argument("--worker-id", help="认领图片时使用的实例ID（默认 主机名:进程号:随机后缀）")
+    parser.add_argument("--lease-seconds", type=int, default=LEASE_SECONDS,
+                       help="认领图片的租约时长（秒），过期未续约的图片可被其他实例重新认领")
+    parser.add_argument("--memory-budget", type=int, default=(default_budget() or 0) // (1024 * 1024),
+                       help="同时处理中的图片的内存预算（MB，按原图宽高估计，默认物理内存的一半，0为不限制）")
+    parser.add_argument("--max-edge", type=int, default=None, help="输出图片最长边上限（默认保持原尺寸）")
+    parser.add_argument("--work-edge", type=int, default=None,
+                       help=f"在最长边不超过该值的缩小副本上推理，再放大蒙版（推荐{WORK_EDGE}）")
+    parser.add_argument("--infer-batch", type=int, default=1,
+                       help="批量推理：每次前向传播最多合并的图片数（线程模式）")
+    parser.add_argument("--flush-timeout", type=float, default=FLUSH_TIMEOUT,
+                       help="批量推理凑batch的最长等待时间（秒）")
+    parser.add_argument("--bench-batch", help="测量各batch大小的推理吞吐量，如 1,2,4,8")
+    parser.add_argument("--bench-models", nargs="?", const=",".join(BENCH_MODELS),
+                       help="对比各模型的速度、峰值内存和相对u2net的蒙版IoU，如 u2net,u2netp:int8,silueta")
+    parser.add_argument("--bench-samples", default=str(SAMPLES_DIR), help="基准测试样本图片目录")
     parser.add_argument("--stats", action="store_true", help="显示处理统计")
+    parser.add_argument("--no-prescreen", action="store_true", help="跳过缩略图预筛选")
+    parser.add_argument("--prescreen-threshold", type=float, default=DEFAULT_THRESHOLD,
+                       help="预筛选最低分数（0-1）")
+    parser.add_argument("--no-dedup", action="store_true", help="跳过感知哈希近似重复检测")
+    parser.add_argument("--duplicate-radius", type=int, default=DUPLICATE_RADIUS,
+                       help="视为近似重复的最大汉明距离（64位dHash）")
     
     args = parser.parse_args()
     
-    processor = ImageProcessor()
+    if args.bench_batch:
+        batch_sizes = [int(size) for size in args.bench_batch.split(',')]
+        print(f"📊 批量推理基准测试: batch {batch_sizes}")
+        report = bench_batch_sizes(batch_sizes, load_samples(args.bench_samples), args.model,
+                                   args.flush_timeout)
+        save_report("segment_batch_bench", report)
+        return
+    
+    if args.bench_models:
+        report = bench_models(args.bench_models.split(','), load_samples(args.bench_samples))
+        save_report("segment_model_bench", report)
+        return
+    
+    processor = ImageProcessor(
+        prescreen=not args.no_prescreen,
+        prescreen_threshold=args.prescreen_threshold,
+        dedup=not args.no_dedup,
+        duplicate_radius=args.duplicate_radius,
+        processes=args.processes,
+        max_edge=args.max_edge,
+        work_edge=args.work_edge,
+        infer_batch=args.infer_batch,
+        flush_timeout=args.flush_timeout,
+        model=args.model,
+        quantize=args.quantize,
+        cutout_cache=not args.no_cutout_cache,
+        cutout_cache_size=args.cutout_cache_size * 1024 * 1024,
+        png_level=args.png_level,
+        formats=[fmt for fmt in args.formats.split(',') if fmt],
+        crop_padding=args.crop_padding if args.crop else None,
+        quality_gate=None if args.no_quality_gate else {
+            'min_foreground': args.min_foreground,
+            'max_foreground': args.max_foreground,
+            'max_islands': args.max_islands,
+            'max_edge_alpha': args.max_edge_alpha,
+        },
+        worker_id=args.worker_id,
+        lease_seconds=args.lease_seconds,
+        memory_budget=args.memory_budget * 1024 * 1024,
+        widths=[int(width) for width in args.widths.split(',') if width],
+        derivative_format=args.derivative_format
+    )
     
     if args.stats:
         stats = processor.get_processing_stats()
@@ -211,9 +1047,13 @@ def main():
         print(f"  总图片数: {stats['total']}")
         print(f"  已处理: {stats['processed']}")
         print(f"  已上传: {stats['uploaded']}")
-        print(f"  待处理: {stats['pending']}")
+        print(f"  已拒绝: {stats['rejected']}")
+        print(f"  待处理: {stats['pending']}（其中 {stats['leased']} 张正由其他实例处理）")
+    elif args.recompress:
+        processor.recompress_pngs(args.batch_size)
     else:
-        processor.process_images_batch(args.batch_size, args.workers)
+        processor.process_images_batch(args.batch_size, args.workers, args.segment_workers,
+                                       args.encode_workers, args.queue_size)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
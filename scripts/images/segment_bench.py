@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+去背景基准测试 - 在固定的本地样本上测量批量推理吞吐量，以及各模型的速度、内存和蒙版质量
+"""
+
+import io
+import sys
+import json
+import time
+import resource
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# 添加项目根目录到路径
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from scripts.images.segmentation import (
+    DEFAULT_MODEL, FLUSH_TIMEOUT, WORK_EDGE, BatchSegmenter, create_session, decode_image
+)
+
+SAMPLES_DIR = Path("fixtures/segmentation")
+
+# 没有本地样本时生成的合成图片数量
+SYNTHETIC_SAMPLES = 32
+
+# 模型对比的默认列表，":int8" 表示本地量化的副本；质量以u2net的蒙版为基准
+BENCH_MODELS = ['u2net', 'u2net:int8', 'u2netp', 'u2netp:int8', 'silueta', 'isnet-general-use']
+BASELINE_MODEL = 'u2net'
+
+def synthetic_samples(count=SYNTHETIC_SAMPLES, size=(1600, 1200)):
+    """生成纯色背景上带一个椭圆主体的JPEG样本"""
+    samples = []
+    for i in range(count):
+        image = Image.new('RGB', size, ((i * 37) % 256, 200, 220))
+        draw = ImageDraw.Draw(image)
+        w, h = size
+        draw.ellipse((w // 4, h // 4, w * 3 // 4, h * 3 // 4), fill=(200, (i * 53) % 256, 40))
+
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        samples.append((f"synthetic_{i:03d}", buffer.getvalue()))
+    return samples
+
+def load_samples(samples_dir=SAMPLES_DIR, limit=None):
+    """加载本地样本图片，返回 [(名称, 字节)]，目录为空时使用合成样本"""
+    paths = sorted(
+        path for path in Path(samples_dir).glob("*")
+        if path.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp')
+    ) if Path(samples_dir).exists() else []
+
+    if not paths:
+        print(f"⚠️ {samples_dir} 中没有样本图片，使用 {SYNTHETIC_SAMPLES} 张合成图片")
+        samples = synthetic_samples()
+    else:
+        samples = [(path.stem, path.read_bytes()) for path in paths]
+
+    return samples[:limit] if limit else samples
+
+def bench_batch_sizes(batch_sizes, samples, model_name=DEFAULT_MODEL, flush_timeout=FLUSH_TIMEOUT):
+    """对每个batch大小测量吞吐量，提交线程数等于batch大小"""
+    images = [decode_image(data, WORK_EDGE) for _, data in samples]
+    session = create_session(model_name, dynamic_batch=True)
+
+    results = []
+    for batch_size in batch_sizes:
+        segmenter = BatchSegmenter(session, batch_size, flush_timeout)
+        with ThreadPoolExecutor(max_workers=batch_size) as executor:
+            # 预热
+            list(executor.map(segmenter.predict, images[:batch_size]))
+
+            started = time.perf_counter()
+            list(executor.map(segmenter.predict, images))
+            elapsed = time.perf_counter() - started
+        segmenter.close()
+
+        result = {
+            'batch_size': batch_size,
+            'batched': segmenter.batched,
+            'images': len(images),
+            'elapsed_seconds': round(elapsed, 3),
+            'images_per_second': round(len(images) / elapsed, 2),
+            'ms_per_image': round(elapsed / len(images) * 1000, 1),
+        }
+        results.append(result)
+        print(f"  batch {batch_size:>3}: {result['images_per_second']} 张/秒 "
+              f"({result['ms_per_image']} ms/张)")
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'model': model_name,
+        'flush_timeout': flush_timeout,
+        'samples': len(samples),
+        'results': results,
+    }
+
+def parse_model_spec(spec):
+    """解析 "模型名[:int8]"，返回 (模型名, 是否量化)"""
+    name, _, variant = spec.partition(':')
+    return name, variant == 'int8'
+
+def run_model(spec, samples, edge):
+    """在独立子进程中运行一个模型，返回 (每张耗时, 二值蒙版, 峰值RSS KB)"""
+    name, quantize = parse_model_spec(spec)
+    session = create_session(name, quantize=quantize)
+    images = [decode_image(data, edge) for _, data in samples]
+
+    # 预热
+    session.predict(images[0])
+
+    timings = []
+    masks = []
+    for image in images:
+        started = time.perf_counter()
+        mask = session.predict(image)[0]
+        timings.append(time.perf_counter() - started)
+        masks.append(np.asarray(mask) >= 128)
+
+    # Linux上ru_maxrss单位为KB，macOS上为字节
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+
+    return timings, masks, peak_rss
+
+def mask_iou(a, b):
+    """两个二值蒙版的交并比，都为空时为1"""
+    union = np.logical_or(a, b).sum()
+    if not union:
+        return 1.0
+    return float(np.logical_and(a, b).sum() / union)
+
+def bench_models(specs, samples, edge=WORK_EDGE):
+    """逐个模型测量 ms/张、峰值RSS 和相对u2net的蒙版IoU
+
+    每个模型在单独的spawn子进程中运行，峰值内存互不影响
+    """
+    specs = [BASELINE_MODEL] + [spec for spec in specs if spec != BASELINE_MODEL]
+    context = multiprocessing.get_context('spawn')
+
+    baseline = None
+    results = []
+    for spec in specs:
+        print(f"🔄 测试模型: {spec}")
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                timings, masks, peak_rss = executor.submit(run_model, spec, samples, edge).result()
+        except Exception as e:
+            print(f"❌ {spec} 运行失败: {e}")
+            results.append({'model': spec, 'error': str(e)})
+            continue
+
+        if spec == BASELINE_MODEL:
+            baseline = masks
+
+        iou = None
+        if baseline is not None:
+            iou = round(float(np.mean([mask_iou(a, b) for a, b in zip(masks, baseline)])), 4)
+
+        results.append({
+            'model': spec,
+            'ms_per_image': round(float(np.mean(timings)) * 1000, 1),
+            'p95_ms': round(float(np.percentile(timings, 95)) * 1000, 1),
+            'peak_rss_mb': round(peak_rss / 1024, 1),
+            'iou_vs_baseline': iou,
+        })
+
+    print(f"\n📊 模型对比（{len(samples)} 张样本，推理分辨率 {edge}，基准 {BASELINE_MODEL}）:")
+    print(f"  {'模型':<24}{'ms/张':>10}{'峰值RSS(MB)':>14}{'IoU':>8}")
+    for result in results:
+        if 'error' in result:
+            print(f"  {result['model']:<24}{'失败':>10}")
+            continue
+        iou = '-' if result['iou_vs_baseline'] is None else result['iou_vs_baseline']
+        print(f"  {result['model']:<24}{result['ms_per_image']:>10}{result['peak_rss_mb']:>14}{iou:>8}")
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'baseline': BASELINE_MODEL,
+        'edge': edge,
+        'samples': [name for name, _ in samples],
+        'results': results,
+    }
+
+def save_report(name, report):
+    """保存基准测试报告到logs目录"""
+    report_path = Path("logs") / f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    report_path.parent.mkdir(exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"📄 详细报告已保存到: {report_path}")
+    return report_path
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+背景分割 - rembg会话管理和去背景，供线程模式和进程池模式共用
+"""
+
+import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import onnxruntime as ort
+from rembg import remove
+from rembg.bg import fix_image_orientation, naive_cutout
+from rembg.sessions import sessions_class
+from rembg.sessions.u2net import U2netSession
+
+from scripts.images.alpha_stats import check_cutout, compute_alpha_stats, crop_cutout
+from scripts.images.encoder import write_derivatives, write_variants
+from scripts.images.placeholder import compute_placeholder
+
+DEFAULT_MODEL = 'u2net'
+
+# 推荐的推理分辨率：u2net输入为320，isnet为1024，留出余量
+WORK_EDGE = 1024
+
+# 批量推理支持的模型输入预处理参数：(均值, 标准差, 输入尺寸)，与rembg各会话的predict一致
+MODEL_INPUTS = {
+    'u2net': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'u2netp': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'u2net_human_seg': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'silueta': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'isnet-general-use': ((0.485, 0.456, 0.406), (1.0, 1.0, 1.0), (1024, 1024)),
+    'isnet-anime': ((0.485, 0.456, 0.406), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+
+# 批量推理的默认参数
+INFER_BATCH_SIZE = 4
+FLUSH_TIMEOUT = 0.02
+
+# 进程池模式下每个工作进程持有的会话和分割参数
+_worker_session = None
+_worker_options = {}
+_worker_encode = {}
+_worker_derivatives = {}
+_worker_crop_padding = None
+_worker_gate = None
+
+def onnx_threads_per_worker(workers):
+    """按CPU核数平均分配每个工作进程的ONNX算子内线程数"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def has_fixed_batch(session):
+    """模型输入的batch维是否固定为1"""
+    return session.inner_session.get_inputs()[0].shape[0] == 1
+
+def find_session_class(model_name):
+    """按模型名查找rembg会话类，未知模型使用u2net"""
+    for candidate in sessions_class:
+        if candidate.name() == model_name:
+            return candidate
+    return U2netSession
+
+def ensure_dynamic_batch(model_path):
+    """生成batch维为动态的模型副本（需要onnx包），返回副本路径，无法生成时返回None"""
+    model_path = Path(model_path)
+    output_path = model_path.with_suffix('.dynamic.onnx')
+    if output_path.exists():
+        return output_path
+
+    try:
+        import onnx
+    except ImportError:
+        print("⚠️ 未安装onnx，无法生成动态batch模型: pip install onnx")
+        return None
+
+    model = onnx.load(str(model_path))
+    graph = model.graph
+    for value in list(graph.input) + list(graph.output) + list(graph.value_info):
+        dims = value.type.tensor_type.shape.dim
+        if dims:
+            dims[0].dim_param = 'batch'
+
+    # 先写临时文件再改名，多个进程同时生成时不会读到半个文件
+    temp_path = output_path.with_suffix(f'.{os.getpid()}.tmp')
+    onnx.save(model, str(temp_path))
+    os.replace(temp_path, output_path)
+    return output_path
+
+def ensure_quantized(model_path):
+    """生成int8动态量化的模型副本，返回副本路径，失败时返回None"""
+    model_path = Path(model_path)
+    output_path = model_path.with_suffix('.int8.onnx')
+    if output_path.exists():
+        return output_path
+
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"🔧 量化模型: {model_path.name} -> {output_path.name}")
+        temp_path = output_path.with_suffix(f'.{os.getpid()}.tmp')
+        quantize_dynamic(str(model_path), str(temp_path), weight_type=QuantType.QUInt8)
+        os.replace(temp_path, output_path)
+        return output_path
+    except Exception as e:
+        print(f"⚠️ 模型量化失败，使用原模型: {e}")
+        return None
+
+def prepare_model(model_name=DEFAULT_MODEL, dynamic_batch=False, quantize=False, fixed_batch=True):
+    """准备模型文件的变体（动态batch、int8量化），返回需要加载的路径，使用原模型时返回None
+
+    在启动工作进程之前调用一次，避免每个进程各自生成副本
+    """
+    model_path = None
+    if dynamic_batch and fixed_batch:
+        model_path = ensure_dynamic_batch(find_session_class(model_name).download_models())
+    if quantize:
+        model_path = ensure_quantized(model_path or find_session_class(model_name).download_models())
+    return model_path
+
+def create_session(model_name=DEFAULT_MODEL, intra_op_threads=None, dynamic_batch=False,
+                   quantize=False):
+    """创建rembg会话，可指定ONNX Runtime算子内线程数
+
+    dynamic_batch: 模型batch维固定为1时，改用batch维动态的副本，供批量推理使用
+    quantize: 改用int8动态量化的副本
+    """
+    sess_opts = ort.SessionOptions()
+    if intra_op_threads:
+        sess_opts.intra_op_num_threads = intra_op_threads
+        sess_opts.inter_op_num_threads = 1
+
+    session = find_session_class(model_name)(model_name, sess_opts, None)
+
+    model_path = prepare_model(model_name, dynamic_batch, quantize, has_fixed_batch(session))
+    if model_path:
+        session.inner_session = ort.InferenceSession(
+            str(model_path), sess_options=sess_opts, providers=session.providers
+        )
+
+    return session
+
+class BatchSegmenter:
+    """批量推理引擎：收集多个线程提交的图片，合并成一个batch做一次前向传播，再拆分蒙版
+
+    predict() 与rembg会话的predict接口一致，可以直接作为session传给remove和predict_mask。
+    预处理和蒙版后处理在调用线程中完成，只有前向传播在推理线程中串行执行
+    """
+
+    def __init__(self, session, batch_size=INFER_BATCH_SIZE, flush_timeout=FLUSH_TIMEOUT):
+        if session.model_name not in MODEL_INPUTS:
+            raise ValueError(f"模型不支持批量推理: {session.model_name}")
+
+        self.session = session
+        self.batch_size = batch_size
+        self.flush_timeout = flush_timeout
+        self.mean, self.std, self.size = MODEL_INPUTS[session.model_name]
+        self.input_name = session.inner_session.get_inputs()[0].name
+
+        # batch维固定为1的模型只能逐张运行
+        self.batched = batch_size > 1 and not has_fixed_batch(session)
+        if batch_size > 1 and not self.batched:
+            print("⚠️ 模型batch维固定为1，批量推理退化为逐张运行")
+
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def predict(self, image):
+        """提交一张图片，阻塞到该图片的蒙版返回"""
+        tensor = self.session.normalize(image, self.mean, self.std, self.size)[self.input_name]
+
+        future = Future()
+        self.pending.put((tensor, future))
+        pred = future.result()
+
+        # 与rembg一致：按单张图片归一化到0-255并缩放回原尺寸
+        pred = (pred - pred.min()) / (pred.max() - pred.min())
+        mask = Image.fromarray((pred * 255).astype('uint8'), mode='L')
+        return [mask.resize(image.size, Image.LANCZOS)]
+
+    def collect(self):
+        """取一个batch：凑满batch_size，或第一张到达后等待flush_timeout，关闭时返回None"""
+        first = self.pending.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self.pending.put(None)
+                break
+            batch.append(item)
+
+        return batch
+
+    def infer(self, tensors):
+        """前向传播，返回每张图片的预测 (H, W)"""
+        if self.batched and len(tensors) > 1:
+            try:
+                outputs = self.session.inner_session.run(None, {self.input_name: np.concatenate(tensors)})
+                return list(outputs[0][:, 0])
+            except Exception as e:
+                print(f"⚠️ 批量推理失败，改为逐张运行: {e}")
+                self.batched = False
+
+        return [self.session.inner_session.run(None, {self.input_name: tensor})[0][0, 0]
+                for tensor in tensors]
+
+    def run(self):
+        """推理线程"""
+        while True:
+            batch = self.collect()
+            if batch is None:
+                return
+
+            try:
+                preds = self.infer([tensor for tensor, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), pred in zip(batch, preds):
+                future.set_result(pred)
+
+    def close(self):
+        """处理完已提交的图片后停止推理线程"""
+        self.pending.put(None)
+        self.thread.join()
+
+def decode_image(image_data, max_edge=None):
+    """从内存解码图片，指定max_edge时缩小到最长边不超过max_edge
+
+    JPEG使用draft模式在解码时按1/2、1/4、1/8缩放，不需要先解出全尺寸像素
+    """
+    image = Image.open(io.BytesIO(image_data))
+    if max_edge:
+        image.draft('RGB', (max_edge, max_edge))
+
+    image = fix_image_orientation(image).convert('RGB')
+    if max_edge and max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    return image
+
+def predict_mask(image, session, work_edge):
+    """在不超过work_edge的缩小副本上预测蒙版，再放大到原图尺寸"""
+    work_image = image
+    if max(image.size) > work_edge:
+        work_image = image.copy()
+        work_image.thumbnail((work_edge, work_edge), Image.BILINEAR, reducing_gap=2.0)
+
+    mask = session.predict(work_image)[0]
+    if mask.size != image.size:
+        mask = mask.resize(image.size, Image.BICUBIC)
+    return mask
+
+def segment_mask(image, session, work_edge=None):
+    """预测蒙版（L模式，与image同尺寸）"""
+    if not work_edge:
+        return remove(image, session=session, only_mask=True)
+
+    # 低分辨率推理，只在输出尺寸上合成透明通道
+    return predict_mask(image, session, work_edge)
+
+def remove_background(image_data, session, max_edge=None, work_edge=None, cache=None, cache_key=None):
+    """去除图片背景，失败时返回None
+
+    max_edge: 输出图片的最长边上限，None时保持原尺寸
+    work_edge: 推理分辨率上限，None时在完整输出尺寸上运行rembg
+    cache/cache_key: 抠图缓存和蒙版的缓存键，命中时跳过推理
+    """
+    try:
+        # 直接从内存解码，不经过临时文件
+        input_image = decode_image(image_data, max_edge)
+
+        mask = cache.get_mask(cache_key) if cache and cache_key else None
+        if mask is None or mask.size != input_image.size:
+            mask = segment_mask(input_image, session, work_edge)
+            if cache and cache_key:
+                cache.put_mask(cache_key, mask)
+
+        return naive_cutout(input_image, mask)
+
+    except Exception as e:
+        print(f"❌ 背景去除失败: {e}")
+        return None
+
+def init_worker(model_name=DEFAULT_MODEL, intra_op_threads=None, max_edge=None, work_edge=None,
+                quantize=False, cache=None, encode_options=None, crop_padding=None, quality_gate=None,
+                derivative_options=None):
+    """进程池初始化：每个工作进程只加载一次模型"""
+    global _worker_session, _worker_crop_padding, _worker_gate
+    _worker_session = create_session(model_name, intra_op_threads, quantize=quantize)
+    _worker_options.update(max_edge=max_edge, work_edge=work_edge, cache=cache)
+    _worker_encode.update(encode_options or {})
+    _worker_crop_padding = crop_padding
+    _worker_gate = quality_gate
+    _worker_derivatives.update(derivative_options or {})
+
+def segment_to_file(image_data, output_path, cache_key=None):
+    """进程池任务：去背景、统计透明通道、裁剪、计算占位图并编码保存，失败时返回None
+
+    未通过质量门槛时不编码，返回 {'rejected': 拒绝原因}
+    """
+    output_image = remove_background(image_data, _worker_session, cache_key=cache_key, **_worker_options)
+    if output_image is None:
+        return None
+
+    alpha_stats = compute_alpha_stats(output_image.getchannel('A'))
+    reason = check_cutout(alpha_stats, _worker_gate) if _worker_gate else None
+    if reason:
+        return {'rejected': reason}
+
+    output_image, geometry = crop_cutout(output_image, alpha_stats['bbox'], _worker_crop_padding)
+    alpha_stats.update(geometry)
+    alpha_stats.update(compute_placeholder(output_image))
+
+    return {
+        'alpha_stats': alpha_stats,
+        'variants': write_variants(output_image, output_path, **_worker_encode),
+        'derivatives': write_derivatives(output_image, output_path, **_worker_derivatives)
+                       if _worker_derivatives.get('widths') else [],
+    }
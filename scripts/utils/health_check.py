@@ -12,10 +12,16 @@ from pathlib import Path
 from datetime import datetime
 import json
 
+# 添加项目根目录到路径
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from scripts.utils.http_client import get_session
+
 class HealthChecker:
     def __init__(self):
         self.db_path = "images.db"
         self.checks = []
+        self.session = get_session()
     
     def add_check(self, name, status, message, details=None):
         """添加检查结果"""
@@ -224,7 +230,7 @@ class HealthChecker:
             try:
                 url = "https://api.unsplash.com/me"
                 headers = {'Authorization': f'Client-ID {unsplash_key}'}
-                response = requests.get(url, headers=headers, timeout=10)
+                response = self.session.get(url, headers=headers, timeout=10)
                 
                 if response.status_code == 200:
                     user_data = response.json()
@@ -242,7 +248,7 @@ class HealthChecker:
             try:
                 url = "https://pixabay.com/api/"
                 params = {'key': pixabay_key, 'q': 'test', 'per_page': 3}
-                response = requests.get(url, params=params, timeout=10)
+                response = self.session.get(url, params=params, timeout=10)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -259,7 +265,7 @@ class HealthChecker:
         """检查网站状态"""
         try:
             # 检查本地开发服务器
-            response = requests.get("http://localhost:3000", timeout=5)
+            response = self.session.get("http://localhost:3000", timeout=5)
             if response.status_code == 200:
                 self.add_check("本地网站", "ok", "本地开发服务器运行正常")
             else:
@@ -273,7 +279,7 @@ class HealthChecker:
         public_url = os.getenv('R2_PUBLIC_URL', 'https://img.thinkora.pics')
         try:
             test_url = f"{public_url}/images/test.png"  # 假设有测试图片
-            response = requests.head(test_url, timeout=10)
+            response = self.session.head(test_url, timeout=10)
             self.add_check("R2图片访问", "ok", "R2图片可正常访问")
         except Exception:
             self.add_check("R2图片访问", "warning", "无法验证R2图片访问（可能没有测试图片）")
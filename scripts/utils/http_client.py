@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+共享HTTP客户端 - 按主机复用连接池，统一超时和失败重试
+"""
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (连接超时, 读取超时) 秒
+DEFAULT_TIMEOUT = (5, 30)
+
+# 常用主机的连接池大小：API请求受限流约束，图片CDN下载并发更高
+POOL_SIZES = {
+    'https://api.unsplash.com': 8,
+    'https://pixabay.com': 8,
+    'https://images.unsplash.com': 16,
+    'https://cdn.pixabay.com': 16,
+}
+DEFAULT_POOL_SIZE = 10
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+# 需要退避重试的响应状态码
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_api_session = None
+_session_lock = threading.Lock()
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """未显式指定timeout的请求使用默认超时"""
+    
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+    
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+def make_retry(total=3, backoff_factor=0.5, retry_status=True):
+    """连接错误、429和5xx时指数退避重试，遵守Retry-After
+    
+    retry_status=False 时只重试连接错误，429和5xx直接返回给调用方
+    """
+    return Retry(
+        total=total,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES if retry_status else (),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+def create_session(timeout=DEFAULT_TIMEOUT, retries=3, retry_status=True):
+    """创建带连接池、超时和重试的Session"""
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    
+    def make_adapter(pool_size):
+        return TimeoutHTTPAdapter(
+            timeout=timeout,
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=make_retry(retries, retry_status=retry_status)
+        )
+    
+    session.mount('https://', make_adapter(DEFAULT_POOL_SIZE))
+    session.mount('http://', make_adapter(DEFAULT_POOL_SIZE))
+    
+    # 更长的前缀优先匹配，每个常用主机使用独立大小的连接池
+    for prefix, pool_size in POOL_SIZES.items():
+        session.mount(prefix, make_adapter(pool_size))
+    
+    return session
+
+def get_session():
+    """获取进程内共享的Session（线程间复用连接）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def get_api_session():
+    """获取进程内共享的API Session（不自动重试429和5xx）
+    
+    重试由调用方负责，每次重试前重新获取限流令牌，重试的请求同样计入配额
+    """
+    global _api_session
+    if _api_session is None:
+        with _session_lock:
+            if _api_session is None:
+                _api_session = create_session(retry_status=False)
+    return _api_session